@@ -0,0 +1,79 @@
+import asyncio
+from utils.logger import Logger
+from typing import Awaitable, Callable
+from config.settings import ANALYSIS_DELAY
+from ollama_client.request_scheduler import background
+
+logger = Logger.get_logger()
+
+
+class AnalysisScheduler:
+    """
+    Runs history analysis in the background, off the interactive path.
+    A run starts once no trigger has arrived for `delay` seconds, so bursts of
+    messages coalesce into one run. At most one run is in flight; triggers that
+    arrive during a run schedule a single follow-up run. While paused, triggers
+    are remembered and the run starts once every pause has been resumed.
+    """
+
+    def __init__(
+            self,
+            run: Callable[[], Awaitable[None]],
+            delay: float = ANALYSIS_DELAY
+    ) -> None:
+
+        self.run = run
+        self.delay = delay
+        self.pending = False
+        self.last_trigger = 0.0
+        self.task: asyncio.Task | None = None
+        self.paused = 0
+
+    def trigger(self) -> None:
+        """
+        Requests an analysis run.
+        """
+        self.pending = True
+        self.last_trigger = asyncio.get_running_loop().time()
+        if not self.paused and (self.task is None or self.task.done()):
+            self.task = asyncio.create_task(self._loop())
+
+    async def cancel(self) -> None:
+        """
+        Cancels the pending or running analysis and waits until it has stopped,
+        so no analysis touches the history while new input is handled.
+        """
+        self.pending = False
+        task, self.task = self.task, None
+        if task and not task.done():
+            task.cancel()
+            await asyncio.wait([task])
+            logger.info("Cancelled history analysis for new input.")
+
+    async def pause(self) -> None:
+        """
+        Stops the pending or running run until resume; a stopped run is repeated then.
+        """
+        self.paused += 1
+        pending = self.pending or (self.task is not None and not self.task.done())
+        await self.cancel()
+        self.pending = pending
+
+    def resume(self) -> None:
+        self.paused = max(self.paused - 1, 0)
+        if self.pending and not self.paused:
+            self.trigger()
+
+    async def _loop(self) -> None:
+        background.set(True)
+        loop = asyncio.get_running_loop()
+        while self.pending:
+            # Debounce: wait until triggers stop arriving
+            while (remaining := self.last_trigger + self.delay - loop.time()) > 0:
+                await asyncio.sleep(remaining)
+
+            self.pending = False
+            try:
+                await self.run()
+            except Exception as e:
+                logger.error(f"History analysis failed: {e}", exc_info=True)
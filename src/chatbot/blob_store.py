@@ -0,0 +1,93 @@
+from utils.logger import Logger
+from chatbot.embedding_cache import content_digest
+
+logger = Logger.get_logger()
+
+
+class BlobStore:
+    """
+    Content-addressed store for indexed bodies (file contents, terminal outputs).
+    Every unique body is kept once under its sha256 digest and reference counted
+    by the project entries using it, so duplicated content costs memory only once.
+    """
+
+    def __init__(self) -> None:
+        self.blobs: dict[str, str] = {}
+        self.refs: dict[str, int] = {}
+
+    def __len__(self) -> int:
+        return len(self.blobs)
+
+    def __contains__(
+            self,
+            digest: str
+    ) -> bool:
+        return digest in self.blobs
+
+    def put(
+            self,
+            content: str
+    ) -> str:
+        """
+        Stores the body (or adds a reference to the stored copy) and returns its digest.
+        """
+        digest = content_digest(content)
+        if digest in self.blobs:
+            self.refs[digest] += 1
+            logger.debug(f"Blob {digest[:12]} is shared by {self.refs[digest]} entries")
+        else:
+            self.blobs[digest] = content
+            self.refs[digest] = 1
+        return digest
+
+    def get(
+            self,
+            digest: str
+    ) -> str | None:
+        return self.blobs.get(digest)
+
+    def retain(
+            self,
+            digest: str
+    ) -> None:
+        """
+        Adds a reference to a stored body, e.g. for entries restored from a session.
+        """
+        if digest in self.blobs:
+            self.refs[digest] += 1
+
+    def release(
+            self,
+            digest: str
+    ) -> None:
+        """
+        Drops a reference; the body is removed with its last reference.
+        """
+        if digest not in self.refs:
+            return
+        self.refs[digest] -= 1
+        if self.refs[digest] <= 0:
+            del self.refs[digest]
+            del self.blobs[digest]
+
+    def to_state(
+            self,
+            digests: set[str]
+    ) -> dict[str, str]:
+        """
+        Returns the stored bodies among the given digests for a saved session.
+        """
+        return {digest: self.blobs[digest] for digest in digests if digest in self.blobs}
+
+    @classmethod
+    def from_state(
+            cls,
+            state: dict[str, str]
+    ) -> "BlobStore":
+        """
+        Restores saved bodies without references; entries restored afterwards retain them.
+        """
+        store = cls()
+        store.blobs = dict(state)
+        store.refs = {digest: 0 for digest in state}
+        return store
@@ -0,0 +1,184 @@
+import os
+import sqlite3
+import hashlib
+import numpy as np
+from collections import OrderedDict
+from utils.logger import Logger
+from config.settings import EMBEDDING_MODEL, EMBEDDING_DB, EMBEDDING_CACHE_SIZE
+
+logger = Logger.get_logger()
+
+
+def content_digest(
+        text: str
+) -> str:
+    """
+    Returns a stable digest of the text, used as a content address.
+    """
+    return hashlib.sha256(text.encode("utf-8", errors="ignore")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Bounded in-memory LRU cache of embeddings keyed by content digest.
+    Entries are evicted from the least recently used end once the
+    total size of the stored vectors exceeds the memory budget.
+    """
+
+    # Approximate per-entry overhead (digest key and dict bookkeeping) in bytes
+    ENTRY_OVERHEAD = 200
+
+    def __init__(
+            self,
+            max_bytes: int = EMBEDDING_CACHE_SIZE
+    ) -> None:
+
+        self.max_bytes = max_bytes
+        self.entries: OrderedDict[str, np.ndarray] = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(
+            self,
+            digest: str
+    ) -> bool:
+        return digest in self.entries
+
+    def _entry_size(
+            self,
+            embedding: np.ndarray
+    ) -> int:
+        return embedding.nbytes + self.ENTRY_OVERHEAD
+
+    def get(
+            self,
+            digest: str
+    ) -> np.ndarray | None:
+        """
+        Returns the cached embedding and marks it as recently used, or None on a miss.
+        """
+        embedding = self.entries.get(digest)
+        if embedding is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(digest)
+        self.hits += 1
+        return embedding
+
+    def put(
+            self,
+            digest: str,
+            embedding: np.ndarray
+    ) -> None:
+        """
+        Stores the embedding and evicts least recently used entries over budget.
+        """
+        embedding = np.asarray(embedding, dtype=np.float32)
+        previous = self.entries.pop(digest, None)
+        if previous is not None:
+            self.bytes -= self._entry_size(previous)
+
+        self.entries[digest] = embedding
+        self.bytes += self._entry_size(embedding)
+
+        while self.bytes > self.max_bytes and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.bytes -= self._entry_size(evicted)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        """
+        Returns the cache counters.
+        """
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class EmbeddingStore:
+    """
+    Persistent, content-addressed embedding cache stored in SQLite.
+    Rows are keyed by the digest of the embedded text and the embedding model,
+    so a model change never returns stale vectors.
+    """
+
+    def __init__(
+            self,
+            path: str = EMBEDDING_DB,
+            model: str = EMBEDDING_MODEL
+    ) -> None:
+
+        self.path = path
+        self.model = model
+        self.connection: sqlite3.Connection | None = None
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.connection = sqlite3.connect(path)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings ("
+                "digest TEXT NOT NULL, model TEXT NOT NULL, vector BLOB NOT NULL, "
+                "PRIMARY KEY (digest, model))"
+            )
+            self.connection.commit()
+            logger.info(f"Embedding store opened at {path}")
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"Failed to open embedding store at {path}: {e}")
+            self.connection = None
+
+    def get(
+            self,
+            digest: str
+    ) -> np.ndarray | None:
+        """
+        Returns the stored embedding for the digest, or None on a miss.
+        """
+        if not self.connection:
+            return None
+        try:
+            row = self.connection.execute(
+                "SELECT vector FROM embeddings WHERE digest = ? AND model = ?",
+                (digest, self.model)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Embedding store lookup failed: {e}")
+            return None
+        if row is None:
+            return None
+        return np.frombuffer(row[0], dtype=np.float32)
+
+    def put(
+            self,
+            digest: str,
+            embedding: np.ndarray
+    ) -> None:
+        """
+        Stores the embedding under the digest.
+        """
+        if not self.connection:
+            return
+        vector = np.asarray(embedding, dtype=np.float32)
+        try:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO embeddings (digest, model, vector) VALUES (?, ?, ?)",
+                (digest, self.model, vector.tobytes())
+            )
+            self.connection.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Embedding store write failed: {e}")
+
+    def close(self) -> None:
+        if self.connection:
+            self.connection.close()
+            self.connection = None
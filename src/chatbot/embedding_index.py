@@ -0,0 +1,722 @@
+import os
+import tempfile
+import threading
+import numpy as np
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor
+from utils.logger import Logger
+from config.settings import ANN_THRESHOLD, ANN_NPROBE, EMBEDDING_STORAGE, EMBEDDING_DIMS, RESCORE_FACTOR, CACHE_DIR
+
+logger = Logger.get_logger()
+
+# Integer codes stored in the type mask of the index
+CONTENT_TYPES = {"file": 0, "terminal": 1}
+
+# Trains IVF indexes off the event loop, one at a time
+_trainer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ivf")
+# Set on shutdown so a training in progress returns instead of holding up the exit
+_stopping = threading.Event()
+
+
+def stop_training() -> None:
+    """
+    Stops the IVF trainer: queued trainings are cancelled and a running one
+    gives up at its next k-means iteration or assignment block.
+    """
+    _stopping.set()
+    _trainer.shutdown(wait=False, cancel_futures=True)
+
+
+class VectorCodec:
+    """
+    Converts normalized float32 embeddings to the storage format of an index:
+    float32, float16, or int8 with one scale per row. Compact formats can also
+    be projected to fewer dimensions with a fixed random orthonormal matrix.
+    """
+
+    DTYPES = {"float32": np.float32, "float16": np.float16, "int8": np.int8}
+
+    def __init__(
+            self,
+            storage: str = EMBEDDING_STORAGE,
+            dims: int = EMBEDDING_DIMS
+    ) -> None:
+
+        if storage not in self.DTYPES:
+            logger.warning(f"Unknown embedding storage '{storage}', using float32")
+            storage = "float32"
+        self.storage = storage
+        self.dtype = self.DTYPES[storage]
+        self.dims = dims
+        self.projection: np.ndarray | None = None
+
+    @property
+    def compact(self) -> bool:
+        return self.storage != "float32" or self.dims > 0
+
+    def fit(
+            self,
+            dim: int
+    ) -> int:
+        """
+        Prepares the projection for embeddings of `dim` dimensions and returns the stored dimension.
+        The projection is seeded, so it is the same in every session.
+        """
+        if not 0 < self.dims < dim:
+            self.projection = None
+            return dim
+        if self.projection is None or self.projection.shape[0] != dim:
+            rng = np.random.default_rng(0)
+            projection, _ = np.linalg.qr(rng.standard_normal((dim, self.dims)))
+            self.projection = projection.astype(np.float32)
+        return self.dims
+
+    def project(
+            self,
+            vectors: np.ndarray
+    ) -> np.ndarray:
+        """
+        Projects one or many normalized vectors and normalizes them again.
+        """
+        if self.projection is None:
+            return vectors
+        projected = vectors @ self.projection
+        norms = np.linalg.norm(projected, axis=-1, keepdims=True)
+        return np.divide(projected, norms, out=np.zeros_like(projected), where=norms > 0)
+
+    def encode(
+            self,
+            vectors: np.ndarray
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Encodes one or many vectors. Returns the codes and the per-row scales.
+        """
+        if self.storage != "int8":
+            return vectors.astype(self.dtype), np.ones(vectors.shape[:-1], dtype=np.float32)
+        scales = np.abs(vectors).max(axis=-1) / 127
+        divisor = np.where(scales > 0, scales, 1.0)
+        codes = np.rint(vectors / divisor[..., None]).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+    def decode(
+            self,
+            codes: np.ndarray,
+            scales: np.ndarray
+    ) -> np.ndarray:
+        return codes.astype(np.float32) * scales[:, None]
+
+    def scores(
+            self,
+            codes: np.ndarray,
+            scales: np.ndarray,
+            query: np.ndarray,
+            rows: np.ndarray | None = None,
+            block: int = 512
+    ) -> np.ndarray:
+        """
+        Scores the codes (or only the given rows) against an encoded-space query.
+        Rows are converted to float32 one block at a time.
+        """
+        count = codes.shape[0] if rows is None else len(rows)
+        scores = np.empty(count, dtype=np.float32)
+        for start in range(0, count, block):
+            part = slice(start, start + block)
+            chunk = codes[part] if rows is None else codes[rows[part]]
+            scores[part] = chunk.astype(np.float32, copy=False) @ query
+        if self.storage == "int8":
+            scores *= scales[:count] if rows is None else scales[rows]
+        return scores
+
+
+class EmbeddingMatrix:
+    """
+    Growing matrix of pre-normalized rows addressed by position, stored in
+    the configured format (not projected, as its scores are compared to fixed
+    thresholds). Capacity doubles when full, so appends are amortized O(1) and
+    scoring all rows is a single dot product.
+    """
+
+    def __init__(
+            self,
+            capacity: int = 16
+    ) -> None:
+
+        self.codec = VectorCodec(dims=0)
+        self.vectors = np.zeros((capacity, 0), dtype=self.codec.dtype)
+        self.scales = np.zeros(capacity, dtype=np.float32)
+        self.size = 0
+
+    def __len__(self) -> int:
+        return self.size
+
+    def append(
+            self,
+            embedding
+    ) -> None:
+        """
+        Appends an embedding. An empty embedding is stored as a zero row
+        to keep positions aligned with the caller's list.
+        """
+        vector = EmbeddingIndex.normalize(embedding)
+        dim = self.vectors.shape[1]
+
+        if dim == 0 and vector.size:
+            dim = vector.size
+            self.vectors = np.zeros((self.vectors.shape[0], dim), dtype=self.codec.dtype)
+        if self.size >= self.vectors.shape[0]:
+            capacity = max(self.vectors.shape[0], 1) * 2
+            vectors = np.zeros((capacity, dim), dtype=self.codec.dtype)
+            vectors[:self.size] = self.vectors[:self.size]
+            scales = np.zeros(capacity, dtype=np.float32)
+            scales[:self.size] = self.scales[:self.size]
+            self.vectors, self.scales = vectors, scales
+
+        if vector.size == dim:
+            self.vectors[self.size], self.scales[self.size] = self.codec.encode(vector)
+        else:
+            self.vectors[self.size] = 0
+            self.scales[self.size] = 0.0
+        self.size += 1
+
+    def truncate(
+            self,
+            size: int
+    ) -> None:
+        """
+        Drops every row from the given position on.
+        """
+        size = max(min(size, self.size), 0)
+        self.vectors[size:self.size] = 0
+        self.scales[size:self.size] = 0.0
+        self.size = size
+
+    def scores(
+            self,
+            query
+    ) -> np.ndarray:
+        """
+        Returns the cosine similarity of the query to every row.
+        """
+        query = EmbeddingIndex.normalize(query)
+        if query.size != self.vectors.shape[1]:
+            return np.zeros(self.size, dtype=np.float32)
+        return self.codec.scores(self.vectors[:self.size], self.scales[:self.size], query)
+
+    def to_state(
+            self,
+            prefix: str,
+            arrays: dict[str, np.ndarray]
+    ) -> dict:
+        """
+        Adds the rows to `arrays` under the prefix and returns the metadata to restore them.
+        """
+        if self.size and self.vectors.shape[1]:
+            arrays[f"{prefix}_vectors"] = self.vectors[:self.size]
+            arrays[f"{prefix}_scales"] = self.scales[:self.size]
+        return {"size": self.size, "prefix": prefix}
+
+    @classmethod
+    def from_state(
+            cls,
+            state: dict,
+            arrays: dict[str, np.ndarray]
+    ) -> "EmbeddingMatrix":
+        """
+        Restores a matrix saved with to_state; the rows may be memory-mapped.
+        """
+        matrix = cls()
+        vectors = arrays.get(f"{state['prefix']}_vectors")
+        scales = arrays.get(f"{state['prefix']}_scales")
+        if vectors is None:
+            matrix.vectors = np.zeros((state["size"], 0), dtype=matrix.codec.dtype)
+            matrix.scales = np.zeros(state["size"], dtype=np.float32)
+        elif vectors.dtype != matrix.codec.dtype:
+            # Saved with another storage format
+            if scales is not None:
+                vectors = matrix.codec.decode(vectors, scales)
+            matrix.vectors, matrix.scales = matrix.codec.encode(np.asarray(vectors, dtype=np.float32))
+        else:
+            matrix.vectors = vectors
+            matrix.scales = np.array(scales) if scales is not None else np.ones(len(vectors), dtype=np.float32)
+        matrix.size = state["size"]
+        return matrix
+
+
+class IVFIndex:
+    """
+    Inverted file index over the rows of an EmbeddingIndex.
+    Rows are assigned to their closest k-means centroid; a search only scores
+    the rows listed under the `nprobe` centroids closest to the query.
+    """
+
+    def __init__(
+            self,
+            nprobe: int = ANN_NPROBE,
+            iterations: int = 10,
+            sample_per_list: int = 64
+    ) -> None:
+
+        self.nprobe = nprobe
+        self.iterations = iterations
+        self.sample_per_list = sample_per_list
+        self.centroids = np.zeros((0, 0), dtype=np.float32)
+        self.lists: list[list[int]] = []
+        self.assignments: dict[int, int] = {}
+        self.trained_size = 0
+
+    def train(
+            self,
+            vectors: np.ndarray
+    ) -> "IVFIndex":
+        """
+        Runs spherical k-means on a sample of the rows and assigns every row to a list.
+        The rows may be encoded; only their direction matters.
+        """
+        size = vectors.shape[0]
+        nlist = int(min(max(np.sqrt(size), 8), 4096, size))
+        rng = np.random.default_rng(0)
+
+        sample_size = min(size, nlist * self.sample_per_list)
+        sample = vectors[np.sort(rng.choice(size, sample_size, replace=False))].astype(np.float32)
+        norms = np.linalg.norm(sample, axis=1, keepdims=True)
+        sample = np.divide(sample, norms, out=np.zeros_like(sample), where=norms > 0)
+        centroids = sample[rng.choice(sample_size, nlist, replace=False)].copy()
+
+        for _ in range(self.iterations):
+            if _stopping.is_set():
+                raise CancelledError()
+            labels = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            filled = norms[:, 0] > 0
+            centroids[filled] = sums[filled] / norms[filled]
+
+        self.centroids = centroids
+        self.lists = [[] for _ in range(nlist)]
+        self.assignments = {}
+        for start in range(0, size, 65536):
+            if _stopping.is_set():
+                raise CancelledError()
+            labels = np.argmax(vectors[start:start + 65536].astype(np.float32, copy=False) @ centroids.T, axis=1)
+            for offset, label in enumerate(labels):
+                self.lists[label].append(start + offset)
+                self.assignments[start + offset] = int(label)
+        self.trained_size = size
+        logger.info(f"Trained IVF index with {nlist} lists over {size} rows")
+        return self
+
+    def add(
+            self,
+            row: int,
+            vector: np.ndarray
+    ) -> None:
+        """
+        Assigns a new or updated row to its closest list.
+        """
+        self.remove(row)
+        label = int(np.argmax(self.centroids @ vector))
+        self.lists[label].append(row)
+        self.assignments[row] = label
+
+    def remove(
+            self,
+            row: int
+    ) -> None:
+        label = self.assignments.pop(row, None)
+        if label is not None:
+            self.lists[label].remove(row)
+
+    def move(
+            self,
+            source: int,
+            target: int
+    ) -> None:
+        """
+        Renames a row after it was moved to another position in the matrix.
+        """
+        label = self.assignments.pop(source, None)
+        if label is not None:
+            rows = self.lists[label]
+            rows[rows.index(source)] = target
+            self.assignments[target] = label
+
+    def candidates(
+            self,
+            query: np.ndarray
+    ) -> np.ndarray:
+        """
+        Returns the rows stored under the lists closest to the query.
+        """
+        nprobe = min(self.nprobe, len(self.lists))
+        closest = np.argpartition(self.centroids @ query, -nprobe)[-nprobe:]
+        rows = [row for label in closest for row in self.lists[label]]
+        return np.asarray(rows, dtype=np.int64)
+
+
+class EmbeddingIndex:
+    """
+    Keeps embeddings in one contiguous, pre-normalized float32 matrix.
+    Every row has an identifier (id column) and a content type code (type mask),
+    so a search is a single matrix-vector product followed by an argpartition top-k.
+    Once the index holds more than `ann_threshold` rows, searches go through an
+    IVF index instead of scoring every row.
+
+    With compact storage, searches score encoded (and optionally projected) rows
+    held in memory, and the best `top_k * RESCORE_FACTOR` candidates are rescored
+    against the float32 matrix, which then lives in a file mapped from disk.
+    """
+
+    def __init__(
+            self,
+            capacity: int = 64,
+            ann_threshold: int = ANN_THRESHOLD,
+            nprobe: int = ANN_NPROBE
+    ) -> None:
+
+        self.ids: list[str] = []
+        self.rows: dict[str, int] = {}
+        self.codec = VectorCodec()
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.codes = np.zeros((0, 0), dtype=self.codec.dtype)
+        self.scales = np.zeros(capacity, dtype=np.float32)
+        self.types = np.zeros(capacity, dtype=np.int8)
+        self.capacity = capacity
+        self.size = 0
+        self.ann_threshold = ann_threshold
+        self.nprobe = nprobe
+        self.ivf: IVFIndex | None = None
+        self.training: Future | None = None
+        # IVF updates made while a new IVF index is trained, replayed onto it before it is swapped in
+        self.journal: list[tuple] = []
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def __contains__(
+            self,
+            identifier: str
+    ) -> bool:
+        return identifier in self.rows
+
+    @staticmethod
+    def normalize(
+            embedding
+    ) -> np.ndarray:
+        """
+        Converts an embedding to a unit length float32 vector.
+        Zero vectors are returned unchanged, so they never match anything.
+        """
+        vector = np.asarray(embedding, dtype=np.float32).ravel()
+        norm = float(np.linalg.norm(vector))
+        if norm > 0:
+            vector = vector / norm
+        return vector
+
+    def _allocate(
+            self,
+            capacity: int,
+            dim: int
+    ) -> np.ndarray:
+        """
+        Allocates the float32 matrix. With compact storage it is backed by an unlinked
+        temporary file, so only the rows read for rescoring are paged into memory.
+        """
+        if not self.codec.compact:
+            return np.zeros((capacity, dim), dtype=np.float32)
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        return np.memmap(tempfile.TemporaryFile(dir=CACHE_DIR), dtype=np.float32, mode="w+", shape=(capacity, dim))
+
+    def _grow(
+            self,
+            dim: int
+    ) -> None:
+        """
+        Doubles the capacity of the matrix (amortized O(1) appends).
+        """
+        capacity = max(self.capacity, 1)
+        while capacity <= self.size:
+            capacity *= 2
+
+        vectors = self._allocate(capacity, dim)
+        vectors[:self.size] = self.vectors[:self.size]
+        types = np.zeros(capacity, dtype=np.int8)
+        types[:self.size] = self.types[:self.size]
+
+        if self.codec.compact:
+            codes = np.zeros((capacity, self.codes.shape[1]), dtype=self.codec.dtype)
+            codes[:self.size] = self.codes[:self.size]
+            scales = np.zeros(capacity, dtype=np.float32)
+            scales[:self.size] = self.scales[:self.size]
+            self.codes, self.scales = codes, scales
+
+        self.vectors, self.types = vectors, types
+        self.capacity = capacity
+
+    def add(
+            self,
+            identifier: str,
+            embedding,
+            content_type: str = "file"
+    ) -> None:
+        """
+        Adds or replaces the embedding stored under the identifier.
+
+        Args:
+            identifier (str): Unique identifier of the row.
+            embedding: The embedding (list or np.ndarray).
+            content_type (str): Type of the content ("file" or "terminal").
+        """
+        vector = self.normalize(embedding)
+        if vector.size == 0:
+            logger.warning(f"Empty embedding for {identifier}, not indexed")
+            return
+
+        if self.vectors.shape[1] == 0:
+            self.vectors = self._allocate(self.capacity, vector.size)
+            if self.codec.compact:
+                self.codes = np.zeros((self.capacity, self.codec.fit(vector.size)), dtype=self.codec.dtype)
+        elif vector.size != self.vectors.shape[1]:
+            logger.error(f"Embedding size {vector.size} does not match index size {self.vectors.shape[1]}")
+            return
+
+        row = self.rows.get(identifier)
+        if row is None:
+            if self.size >= self.capacity:
+                self._grow(vector.size)
+            row = self.size
+            self.size += 1
+            self.ids.append(identifier)
+            self.rows[identifier] = row
+
+        self.vectors[row] = vector
+        self.types[row] = CONTENT_TYPES.get(content_type, -1)
+        search_vector = self.codec.project(vector)
+        if self.codec.compact:
+            self.codes[row], self.scales[row] = self.codec.encode(search_vector)
+        self._update_ivf("add", row, search_vector)
+        self._train()
+
+    def remove(
+            self,
+            identifier: str
+    ) -> None:
+        """
+        Removes a row by moving the last row into its place.
+        """
+        row = self.rows.pop(identifier, None)
+        if row is None:
+            return
+
+        last = self.size - 1
+        self._update_ivf("remove", row)
+        if row != last:
+            moved = self.ids[last]
+            self.vectors[row] = self.vectors[last]
+            self.types[row] = self.types[last]
+            if self.codec.compact:
+                self.codes[row] = self.codes[last]
+                self.scales[row] = self.scales[last]
+            self.ids[row] = moved
+            self.rows[moved] = row
+            self._update_ivf("move", last, row)
+
+        self.ids.pop()
+        self.size = last
+
+    def score(
+            self,
+            query,
+            identifiers: list[str]
+    ) -> list[tuple[str, float]]:
+        """
+        Returns the similarity of the query to each of the given identifiers.
+        """
+        identifiers = [identifier for identifier in identifiers if identifier in self.rows]
+        query = self.normalize(query)
+        if not identifiers or query.size != self.vectors.shape[1]:
+            return [(identifier, 0.0) for identifier in identifiers]
+
+        rows = [self.rows[identifier] for identifier in identifiers]
+        scores = self.vectors[rows] @ query
+        return [(identifier, float(score)) for identifier, score in zip(identifiers, scores)]
+
+    def search(
+            self,
+            query,
+            top_k: int = 1,
+            similarity_threshold: float = 0.0,
+            content_type: str | None = None
+    ) -> list[tuple[str, float]]:
+        """
+        Returns up to top_k (identifier, similarity) pairs sorted by similarity.
+
+        Args:
+            query: The query embedding.
+            top_k (int): Maximum number of results.
+            similarity_threshold (float): Minimum similarity score to consider.
+            content_type (str, optional): Restricts the search to one content type.
+        """
+        if self.size == 0 or top_k <= 0:
+            return []
+
+        query = self.normalize(query)
+        if query.size != self.vectors.shape[1]:
+            return []
+
+        compact = self.codec.compact
+        search_query = self.codec.project(query)
+        rows = self._candidate_rows(search_query)
+        if compact:
+            if rows is None:
+                scores = self.codec.scores(self.codes[:self.size], self.scales[:self.size], search_query)
+            else:
+                scores = self.codec.scores(self.codes, self.scales, search_query, rows)
+        elif rows is None:
+            scores = self.vectors[:self.size] @ query
+        else:
+            scores = self.vectors[rows] @ query
+        types = self.types[:self.size] if rows is None else self.types[rows]
+
+        # Compact scores are approximate, the threshold is applied after rescoring.
+        mask = np.ones(scores.size, dtype=bool) if compact else scores >= similarity_threshold
+        if content_type:
+            mask &= types == CONTENT_TYPES.get(content_type, -1)
+        candidates = np.flatnonzero(mask)
+
+        if candidates.size == 0:
+            return []
+
+        pool = top_k * RESCORE_FACTOR if compact else top_k
+        if candidates.size > pool:
+            top = np.argpartition(scores[candidates], -pool)[-pool:]
+            candidates = candidates[top]
+
+        selected = candidates if rows is None else rows[candidates]
+        scores = scores[candidates]
+        if compact:
+            scores = self.vectors[selected] @ query
+            keep = scores >= similarity_threshold
+            selected, scores = selected[keep], scores[keep]
+
+        order = np.argsort(scores)[::-1][:top_k]
+        return [(self.ids[selected[i]], float(scores[i])) for i in order]
+
+    def to_state(
+            self,
+            prefix: str,
+            arrays: dict[str, np.ndarray]
+    ) -> dict:
+        """
+        Adds the matrix and type mask to `arrays` under the prefix and
+        returns the metadata (id column) needed to restore them.
+        """
+        if self.size:
+            arrays[f"{prefix}_vectors"] = self.vectors[:self.size]
+            arrays[f"{prefix}_types"] = self.types[:self.size]
+            if self.codec.compact:
+                arrays[f"{prefix}_codes"] = self.codes[:self.size]
+                arrays[f"{prefix}_scales"] = self.scales[:self.size]
+        return {"ids": self.ids, "prefix": prefix, "storage": self.codec.storage, "dims": self.codec.dims}
+
+    @classmethod
+    def from_state(
+            cls,
+            state: dict,
+            arrays: dict[str, np.ndarray]
+    ) -> "EmbeddingIndex":
+        """
+        Restores an index saved with to_state. The matrix may be memory-mapped;
+        it is copied into memory only when the index grows.
+        """
+        index = cls()
+        vectors = arrays.get(f"{state['prefix']}_vectors")
+        if vectors is None:
+            return index
+
+        index.ids = list(state["ids"])
+        index.rows = {identifier: row for row, identifier in enumerate(index.ids)}
+        index.vectors = vectors
+        index.types = np.array(arrays[f"{state['prefix']}_types"], dtype=np.int8)
+        index.size = len(index.ids)
+        index.capacity = index.size
+
+        if index.codec.compact:
+            dims = index.codec.fit(vectors.shape[1])
+            codes = arrays.get(f"{state['prefix']}_codes")
+            if codes is not None and (state.get("storage"), state.get("dims")) == (index.codec.storage, index.codec.dims):
+                index.codes = codes
+                index.scales = np.array(arrays[f"{state['prefix']}_scales"])
+            else:
+                # Saved with another storage format, encode the full vectors again
+                index.codes = np.zeros((index.size, dims), dtype=index.codec.dtype)
+                index.scales = np.zeros(index.size, dtype=np.float32)
+                for start in range(0, index.size, 16384):
+                    part = slice(start, start + 16384)
+                    index.codes[part], index.scales[part] = index.codec.encode(
+                        index.codec.project(np.asarray(vectors[part], dtype=np.float32))
+                    )
+        index._train()
+        return index
+
+    def _update_ivf(
+            self,
+            operation: str,
+            *args
+    ) -> None:
+        """
+        Applies a row update (IVFIndex add, remove or move) to the IVF index in use
+        and records it for the one being trained.
+        """
+        if self.ivf:
+            getattr(self.ivf, operation)(*args)
+        if self.training is not None:
+            self.journal.append((operation, *args))
+
+    def _train(self) -> None:
+        """
+        Starts (re)training the IVF index in the background whenever the index has
+        doubled since the last training. It is built on the same (encoded) rows the search scores.
+        Searches keep using the current IVF index, or a flat search, until the new one is swapped in.
+        """
+        self._swap()
+        if self.training is not None or self.size <= self.ann_threshold or _stopping.is_set():
+            return
+        if self.ivf is not None and self.size < 2 * self.ivf.trained_size:
+            return
+
+        rows = self.codes[:self.size] if self.codec.compact else self.vectors[:self.size]
+        self.journal = []
+        self.training = _trainer.submit(IVFIndex(self.nprobe).train, rows)
+
+    def _swap(self) -> None:
+        """
+        Swaps in a trained IVF index once its training has finished, after replaying
+        the row updates made while it was trained.
+        """
+        if self.training is None or not self.training.done():
+            return
+
+        training, self.training = self.training, None
+        journal, self.journal = self.journal, []
+        try:
+            ivf = training.result()
+        except Exception as e:
+            logger.error(f"Failed to train IVF index: {e}")
+            return
+        for operation, *args in journal:
+            getattr(ivf, operation)(*args)
+        self.ivf = ivf
+
+    def _candidate_rows(
+            self,
+            query: np.ndarray
+    ) -> np.ndarray | None:
+        """
+        Returns the rows to score through the IVF index, or None for a flat search.
+        """
+        if self.size <= self.ann_threshold:
+            self.ivf = None
+            return None
+
+        self._swap()
+        return None if self.ivf is None else self.ivf.candidates(query)
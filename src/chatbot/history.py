@@ -1,5 +1,7 @@
 import os
 import re
+import mmap
+import uuid
 import asyncio
 import aiofiles
 import numpy as np
@@ -7,9 +9,18 @@ from datetime import datetime
 from utils.logger import Logger
 from typing import Tuple, Optional
 from chatbot.helper import PromptHelper
-from ollama_client.api_client import OllamaClient
+from chatbot.embedding_index import EmbeddingIndex, EmbeddingMatrix, stop_training
+from chatbot.lexical_index import LexicalIndex
+from chatbot.blob_store import BlobStore
+from chatbot.session_store import SessionStore
+from chatbot.summary_store import SummaryStore
+from chatbot.analysis_scheduler import AnalysisScheduler
+from chatbot.prompt_builder import PromptBuilder, estimate_tokens, truncate_to_tokens
+from chatbot.embedding_cache import EmbeddingCache, EmbeddingStore, content_digest
+from ollama_client.embedding_batcher import EmbeddingBatcher
+from ollama_client.request_scheduler import background
 from sklearn.metrics.pairwise import cosine_similarity
-from config.settings import OFF_THR, MSG_THR, CONT_THR, NUM_MSG, OFF_FREQ, SLICE_SIZE 
+from config.settings import Mode, MODE_CONFIGS, OFF_THR, MSG_THR, CONT_THR, NUM_MSG, OFF_FREQ, SLICE_SIZE, PERSIST_EMBEDDINGS, PERSIST_SESSION, INDEX_CHUNK_LINES, INDEX_CHUNK_OVERLAP, TOP_K_CHUNKS, HYBRID_WEIGHT, SUMMARIZE_FILES, SUMMARY_TOKENS, LAZY_FILE_CONTENT
 
 logger = Logger.get_logger()
 
@@ -17,54 +28,250 @@ class Project:
 
     def __init__(
             self, 
-            name: str = ""
+            name: str = "",
+            blobs: BlobStore | None = None
     ) -> None:
 
         self.name:str = name
+        self.root: str = ""
+        self.manifest: dict[str, dict] = {}
+        self.blobs = blobs if blobs is not None else BlobStore()
         self.file_embeddings: dict[str, dict] = {}
+        self.chunks: dict[str, tuple[str, int, int]] = {}
+        self.chunk_rows: dict[str, str] = {}
+        self.row_chunks: dict[str, list[str]] = {}
+        self.index = EmbeddingIndex()
+        self.lexical = LexicalIndex()
         self.folder_structure: dict = {}
+        self.summaries: dict[str, str] = {} # File path -> summary of its current content
+
+    @staticmethod
+    def split_chunks(
+            content: str,
+            chunk_lines: int = INDEX_CHUNK_LINES,
+            overlap: int = INDEX_CHUNK_OVERLAP
+    ) -> list[tuple[int, int, str]]:
+        """
+        Splits content into overlapping windows of lines.
+
+        Returns:
+            list[tuple[int, int, str]]: (first line, last line, text) for every chunk,
+            line numbers are 1-based and inclusive.
+        """
+        lines = content.splitlines()
+        if not lines:
+            return []
+
+        step = max(chunk_lines - overlap, 1)
+        chunks = []
+        for start in range(0, len(lines), step):
+            end = min(start + chunk_lines, len(lines))
+            chunks.append((start + 1, end, "\n".join(lines[start:end])))
+            if end == len(lines):
+                break
+        return chunks
 
     def _index_content(
             self, 
             identifier: str, 
             content: str, 
-            embedding: np.ndarray, 
-            content_type: str = "file"
+            embeddings: list, 
+            content_type: str = "file",
+            line_ranges: list[tuple[int, int]] | None = None
     ) -> None:
         """
         Generic method to index any content (files or terminal outputs).
+        The body goes to the shared blob store and the entry references it by hash.
+        Files in lazy mode keep only their size, mtime and chunk offsets instead.
+        Chunks with identical text share one row of the embedding index; every chunk
+        gets its own document in the lexical index.
 
         Args:
             identifier (str): Unique identifier (e.g., file path or generated key).
             content (str): The content to index.
-            embedding (np.ndarray): The computed embedding.
+            embeddings (list): One computed embedding per chunk.
             content_type (str): Type of the content ("file" or "terminal").
+            line_ranges (list): (first line, last line) of every chunk.
         """
+        self.remove_content(identifier)
+
+        if line_ranges is None:
+            line_ranges = [(1, max(len(content.splitlines()), 1))]
+
+        lines = content.splitlines()
+        chunk_ids = []
+        for number, ((start, end), embedding) in enumerate(zip(line_ranges, embeddings)):
+            chunk_id = f"{identifier}#{number}"
+            text = "\n".join(lines[start - 1:end])
+            row = f"{content_type}:{content_digest(text)}"
+            self.chunks[chunk_id] = (identifier, start, end)
+            self.chunk_rows[chunk_id] = row
+            refs = self.row_chunks.setdefault(row, [])
+            if not refs:
+                self.index.add(row, embedding, content_type)
+            refs.append(chunk_id)
+            self.lexical.add(chunk_id, identifier + "\n" + text)
+            chunk_ids.append(chunk_id)
+
+        lazy = None
+        if content_type == "file" and LAZY_FILE_CONTENT and content:
+            lazy = self._file_offsets(identifier, content, line_ranges)
+
         content_info = {
             "identifier": identifier,
-            "content": content,
-            "embedding": embedding,
-            "type": content_type
+            "digest": content_digest(content) if lazy else self.blobs.put(content),
+            "type": content_type,
+            "chunks": chunk_ids
         }
+        if lazy:
+            content_info.update(lazy, lazy=True)
         self.file_embeddings[identifier] = content_info
-        logger.debug(f"Project '{self.name}': Added {content_type} content with id {identifier}")
+        logger.debug(f"Project '{self.name}': Added {content_type} content with id {identifier} ({len(chunk_ids)} chunks)")
+
+    def remove_content(
+            self,
+            identifier: str
+    ) -> None:
+        """
+        Removes indexed content and all of its chunks.
+        """
+        self.summaries.pop(identifier, None)
+        content_info = self.file_embeddings.pop(identifier, None)
+        if not content_info:
+            return
+        if not content_info.get("lazy"):
+            self.blobs.release(content_info["digest"])
+        for chunk_id in content_info.get("chunks", []):
+            self.chunks.pop(chunk_id, None)
+            self.lexical.remove(chunk_id)
+            row = self.chunk_rows.pop(chunk_id, None)
+            refs = self.row_chunks.get(row, [])
+            if chunk_id in refs:
+                refs.remove(chunk_id)
+            if not refs:
+                self.row_chunks.pop(row, None)
+                self.index.remove(row)
+
+    @staticmethod
+    def _file_offsets(
+            path: str,
+            content: str,
+            line_ranges: list[tuple[int, int]]
+    ) -> dict | None:
+        """
+        Returns the size, mtime and byte range of every chunk of a file on disk, or None
+        when the content does not match the file byte for byte (other encodings, CRLF line endings).
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+
+        line_starts = [0]
+        for line in content.splitlines(keepends=True):
+            line_starts.append(line_starts[-1] + len(line.encode("utf-8")))
+        if line_starts[-1] != stat.st_size:
+            return None
+
+        return {
+            "size": stat.st_size,
+            "mtime": stat.st_mtime_ns,
+            "offsets": [(line_starts[start - 1], line_starts[end]) for start, end in line_ranges]
+        }
+
+    def _read_lazy(
+            self,
+            info: dict,
+            start: int,
+            end: int
+    ) -> str | None:
+        """
+        Reads a line range made of whole chunks of a lazy file entry through mmap.
+        Returns None if the range does not start and end on chunk boundaries or the
+        file changed on disk since it was indexed (see changed_on_disk).
+        """
+        starts, ends = {}, {}
+        for chunk_id, (start_byte, end_byte) in zip(info["chunks"], info["offsets"]):
+            _, first, last = self.chunks[chunk_id]
+            starts[first] = start_byte
+            ends[last] = end_byte
+        if start not in starts or end not in ends:
+            return None
+
+        path = info["identifier"]
+        try:
+            stat = os.stat(path)
+            if stat.st_size != info["size"] or stat.st_mtime_ns != info["mtime"]:
+                logger.warning(f"'{path}' changed on disk since it was indexed.")
+                return None
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                text = data[starts[start]:ends[end]].decode("utf-8", errors="ignore")
+        except (OSError, ValueError) as e:
+            logger.error(f"Error reading lines {start}-{end} of {path}: {e}")
+            return None
+        return "\n".join(text.splitlines())
+
+    @staticmethod
+    def changed_on_disk(
+            info: dict
+    ) -> bool:
+        """
+        Returns True if the file of a lazy entry was modified or removed since it was indexed.
+        """
+        try:
+            stat = os.stat(info["identifier"])
+        except OSError:
+            return True
+        return stat.st_size != info["size"] or stat.st_mtime_ns != info["mtime"]
+
+    def score_chunks(
+            self,
+            query_embedding: np.ndarray,
+            chunk_ids: list[str]
+    ) -> list[tuple[str, float]]:
+        """
+        Returns the similarity of the query to each of the given chunks.
+        """
+        scores = dict(self.index.score(query_embedding, list({self.chunk_rows[chunk_id] for chunk_id in chunk_ids})))
+        return [
+            (chunk_id, scores[self.chunk_rows[chunk_id]])
+            for chunk_id in chunk_ids if self.chunk_rows[chunk_id] in scores
+        ]
+
+    def search_chunks(
+            self,
+            query_embedding: np.ndarray,
+            top_k: int,
+            similarity_threshold: float,
+            content_type: Optional[str] = None
+    ) -> list[tuple[str, float]]:
+        """
+        Searches the embedding index and returns every chunk of the top_k matching rows.
+        """
+        return [
+            (chunk_id, similarity)
+            for row, similarity in self.index.search(query_embedding, top_k, similarity_threshold, content_type)
+            for chunk_id in self.row_chunks.get(row, [])
+        ]
 
     def _index_file(
             self, 
             file_path: str, 
             content: str, 
-            embedding: np.ndarray
+            embeddings: list,
+            line_ranges: list[tuple[int, int]] | None = None
     ) -> None:
         """
-        Indexes a file's embedding, wrapping the file path as the unique identifier.
+        Indexes a file's chunk embeddings, wrapping the file path as the unique identifier.
         """
-        self._index_content(file_path, content, embedding, content_type="file")
+        self._index_content(file_path, content, embeddings, content_type="file", line_ranges=line_ranges)
 
     def _index_terminal_output(
             self, 
             output: str, 
             identifier: str, 
-            embedding: np.ndarray
+            embeddings: list,
+            line_ranges: list[tuple[int, int]] | None = None
     ) -> None:
         """
         Indexes terminal code blocks or output, generating a unique identifier if not provided.
@@ -72,7 +279,118 @@ class Project:
         if not identifier:
             # Generate a unique identifier, e.g., using a timestamp.
             identifier = f"terminal_{datetime.now().isoformat()}"
-        self._index_content(identifier, output, embedding, content_type="terminal")
+        self._index_content(identifier, output, embeddings, content_type="terminal", line_ranges=line_ranges)
+
+    def to_state(
+            self,
+            prefix: str,
+            arrays: dict[str, np.ndarray]
+    ) -> dict:
+        """
+        Returns the project metadata for a saved session and adds its embedding matrix,
+        lexical index and chunk table to `arrays`. The metadata holds one entry per file;
+        chunk line ranges, byte offsets and index rows are saved as arrays in file order.
+        Bodies are saved with the blob store; file contents are read from disk again when needed.
+        """
+        files = list(self.file_embeddings.values())
+        chunk_ids = [chunk_id for info in files for chunk_id in info["chunks"]]
+        if files:
+            arrays[f"{prefix}_chunk_counts"] = np.array([len(info["chunks"]) for info in files], dtype=np.int32)
+            arrays[f"{prefix}_chunk_lines"] = np.array(
+                [self.chunks[chunk_id][1:] for chunk_id in chunk_ids], dtype=np.int32
+            )
+            arrays[f"{prefix}_chunk_offsets"] = np.array([
+                offsets for info in files
+                for offsets in info.get("offsets", [(0, 0)] * len(info["chunks"]))
+            ], dtype=np.int64)
+            arrays[f"{prefix}_chunk_rows"] = np.array(
+                [self.index.rows[self.chunk_rows[chunk_id]] for chunk_id in chunk_ids], dtype=np.int32
+            )
+
+        return {
+            "name": self.name,
+            "root": self.root,
+            "manifest": self.manifest,
+            "files": [{key: value for key, value in info.items() if key not in ("chunks", "offsets")} for info in files],
+            "folder_structure": self.folder_structure,
+            "summaries": self.summaries,
+            "index": self.index.to_state(prefix, arrays),
+            "lexical": self.lexical.to_state(f"{prefix}_lexical", arrays),
+            "prefix": prefix
+        }
+
+    @classmethod
+    def from_state(
+            cls,
+            state: dict,
+            arrays: dict[str, np.ndarray],
+            blobs: BlobStore
+    ) -> "Project":
+        """
+        Restores a project saved with to_state, retaining its bodies in the shared blob store.
+        """
+        project = cls(state["name"], blobs)
+        project.root = state["root"]
+        project.manifest = state["manifest"]
+        project.folder_structure = state["folder_structure"]
+        project.summaries = state.get("summaries", {})
+        project.index = EmbeddingIndex.from_state(state["index"], arrays)
+        project.lexical = LexicalIndex.from_state(state["lexical"], arrays)
+
+        columns = ("chunk_counts", "chunk_lines", "chunk_offsets", "chunk_rows")
+        counts, lines, offsets, rows = (
+            arrays[f"{state['prefix']}_{name}"].tolist() if state["files"] else [] for name in columns
+        )
+        rows = [project.index.ids[row] for row in rows]
+        position = 0
+        for info, count in zip(state["files"], counts):
+            identifier = info["identifier"]
+            info["chunks"] = [f"{identifier}#{number}" for number in range(count)]
+            if info.get("lazy"):
+                info["offsets"] = [tuple(offset) for offset in offsets[position:position + count]]
+            else:
+                blobs.retain(info["digest"])
+            for number, chunk_id in enumerate(info["chunks"], position):
+                start, end = lines[number]
+                project.chunks[chunk_id] = (identifier, start, end)
+                project.chunk_rows[chunk_id] = rows[number]
+                project.row_chunks.setdefault(rows[number], []).append(chunk_id)
+            project.file_embeddings[identifier] = info
+            position += count
+        return project
+
+    async def get_content(
+            self,
+            identifier: str
+    ) -> str:
+        """
+        Returns indexed content, reading the file if its body is not kept in the blob store.
+        """
+        content = self.blobs.get(self.file_embeddings.get(identifier, {}).get("digest", ""))
+        if content is None:
+            _, content = await self._read_file(identifier)
+        return content
+
+    async def get_lines(
+            self,
+            identifier: str,
+            start: int,
+            end: int
+    ) -> str | None:
+        """
+        Returns the given line range of indexed content. Lazy file entries read
+        only the bytes of the range. Returns None when the file changed on disk since
+        it was indexed, as its line numbers no longer match the indexed chunks.
+        """
+        info = self.file_embeddings.get(identifier, {})
+        if info.get("lazy"):
+            text = await asyncio.to_thread(self._read_lazy, info, start, end)
+            if text is not None:
+                return text
+            if self.changed_on_disk(info):
+                return None
+        content = await self.get_content(identifier)
+        return "\n".join(content.splitlines()[start - 1:end])
 
     async def _read_file(
             self, 
@@ -111,12 +429,14 @@ class Topic:
             name (str): The topic name.
             description (str): A textual description of the topic.
         """
+        self.uid = uuid.uuid4().hex
         self.name = name
         self.description = description
         self.embedded_description = np.array([])
         self.history: list[dict[str, str]] = []
-        self.history_embeddings = [] 
-        self.embedding_cache: dict[str, np.ndarray] = {}
+        self.history_embeddings = EmbeddingMatrix()
+        self.analyzed_size = 0 # History length at the last off-topic analysis
+        self.prefix_start = 0 # First message of the history window sent to the model
   
     async def add_message(
             self, 
@@ -129,6 +449,54 @@ class Topic:
         self.history_embeddings.append(embedding)
         logger.info(f"Message added to: {self.name}")
 
+    def truncate(
+            self,
+            size: int
+    ) -> None:
+        """Keeps only the first `size` messages and their embeddings."""
+        self.history = self.history[:size]
+        self.history_embeddings.truncate(size)
+        self.prefix_start = min(self.prefix_start, size)
+
+    def to_state(
+            self,
+            prefix: str,
+            arrays: dict[str, np.ndarray]
+    ) -> dict:
+        """
+        Returns the topic metadata for a saved session and adds its embeddings to `arrays`.
+        """
+        if len(self.embedded_description):
+            arrays[f"{prefix}_description"] = np.asarray(self.embedded_description, dtype=np.float32)
+        return {
+            "uid": self.uid,
+            "name": self.name,
+            "description": self.description,
+            "history": self.history,
+            "history_embeddings": self.history_embeddings.to_state(f"{prefix}_history", arrays),
+            "prefix_start": self.prefix_start
+        }
+
+    @classmethod
+    def from_state(
+            cls,
+            state: dict,
+            arrays: dict[str, np.ndarray],
+            prefix: str
+    ) -> "Topic":
+        """
+        Restores a topic saved with to_state.
+        """
+        topic = cls(state["name"], state["description"])
+        topic.uid = state["uid"]
+        topic.history = state["history"]
+        topic.history_embeddings = EmbeddingMatrix.from_state(state["history_embeddings"], arrays)
+        topic.prefix_start = min(state.get("prefix_start", 0), len(topic.history))
+        description = arrays.get(f"{prefix}_description")
+        if description is not None:
+            topic.embedded_description = np.asarray(description)
+        return topic
+
     async def get_relevant_context(
             self, 
             embedding: np.ndarray
@@ -146,11 +514,11 @@ class Topic:
                 - The best similarity score.
                 - The index of the best matching message (or -1 if not found).
         """
-        if not self.history_embeddings:
+        if len(self.history_embeddings) == 0:
             logger.info("No history embeddings found. Returning empty context.")
             return 0.0, -1
 
-        similarities = cosine_similarity([embedding], self.history_embeddings)[0]
+        similarities = self.history_embeddings.scores(embedding)
         best_index = int(np.argmax(similarities))
         best_similarity = float(similarities[best_index])
         logger.debug(f"Best similarity score: {best_similarity} at index {best_index}")
@@ -173,15 +541,27 @@ class HistoryManager:
             similarity_threshold (float): Threshold for determining similarity.
         """
         self.file_utils = manager.file_utils
+        self.client = manager.client
         self.helper = manager._handle_helper_mode
-        self.tasker = manager.deploy_chatbot_method
         self.ui = manager.ui
         self.similarity_threshold = MSG_THR
         self.topics: list[Topic] = []
+        self.topic_index = EmbeddingIndex()
+        self.topic_lookup: dict[str, Topic] = {}
         self.current_topic = Topic("Initial topic")
-        self.embedding_cache: dict[str, np.ndarray] = {}
+        self.embedding_cache = EmbeddingCache()
+        self.embedding_store = EmbeddingStore() if PERSIST_EMBEDDINGS else None
+        self.session_store = SessionStore() if PERSIST_SESSION else None
+        self.summary_store = SummaryStore() if SUMMARIZE_FILES else None
+        self.summary_queue: dict[str, tuple[Project, str]] = {}
+        self.summarizer = AnalysisScheduler(self._summarize_files)
+        self.reindexing: dict[str, asyncio.Task] = {}
+        self.pending_message: asyncio.Task | None = None # Query added once its embedding arrives
+        self.embedding_batcher = EmbeddingBatcher(self.client.fetch_embeddings)
+        self.blobs = BlobStore()
         self.projects: list[Project] = []
-        self.current_project = Project("Unsorted")
+        self.current_project = Project("Unsorted", self.blobs)
+        self.analysis = AnalysisScheduler(self._analyze_history)
     
     async def add_message(
             self, 
@@ -197,14 +577,18 @@ class HistoryManager:
             role (str): Sender's role.
             message (str): The message text.
         """
-        if not embedding:
+        if self.pending_message:
+            # The query a response answers is added first
+            await asyncio.wait([self.pending_message])
+            self.pending_message = None
+        if embedding is None:
             embedding = await self.fetch_embedding(message)
         topic = await self._match_topic(embedding, exclude_topic = self.current_topic)
         if topic:
             await self.switch_topic(topic) 
 
         await self.current_topic.add_message(role, message,embedding)
-        asyncio.create_task(self._analyze_history())
+        self.analysis.trigger()
  
     async def add_file(
             self, 
@@ -229,7 +613,7 @@ class HistoryManager:
 
             if not self.current_project.folder_structure and not folder:
                 if await self.ui.yes_no_prompt("Do you want to generate structure for this file's folder?","No"): 
-                    new_project = Project(new_project_name)
+                    new_project = Project(new_project_name, self.blobs)
                     try:
                         folder_path = os.path.dirname(file_path)
                         structure = self.file_utils.generate_structure(folder_path, folder_path)
@@ -240,12 +624,77 @@ class HistoryManager:
                     
                     self.current_project = new_project
 
-        # Compute embedding for file path + content
-        combined_content = f"Path: {file_path}\nContent: {content}"
-        file_embedding = await self.fetch_embedding(combined_content)
+        # Skip re-embedding when the manifest shows the content is unchanged
+        digest = content_digest(content)
+        manifest_entry = self.current_project.manifest.get(file_path)
+        if manifest_entry is not None:
+            if manifest_entry.get("hash") == digest and file_path in self.current_project.file_embeddings:
+                logger.info(f"File '{file_path}' is unchanged, keeping its index.")
+                return
+            manifest_entry["hash"] = digest
+
+        # Compute one embedding per chunk of the content
+        line_ranges, embeddings = await self._embed_chunks(content)
         
         # Store the file in the project using a universal indexing method
-        self.current_project._index_content(file_path, content, file_embedding, content_type="file")
+        self.current_project._index_content(file_path, content, embeddings, content_type="file", line_ranges=line_ranges)
+
+        self._queue_summary(self.current_project, file_path, digest)
+
+    def _queue_summary(
+            self,
+            project: Project,
+            identifier: str,
+            digest: str
+    ) -> None:
+        """
+        Attaches the stored summary of the content to the project, or queues the file for summarizing.
+        """
+        if not self.summary_store:
+            return
+        summary = self.summary_store.get(digest)
+        if summary is None:
+            self.summary_queue[digest] = (project, identifier)
+            self.summarizer.trigger()
+        else:
+            project.summaries[identifier] = summary
+
+    def _reindex_later(
+            self,
+            project: Project,
+            identifier: str
+    ) -> None:
+        """
+        Indexes a file that changed on disk again in the background, so later prompts see its new chunks.
+        """
+        if identifier in self.reindexing:
+            return
+        task = asyncio.create_task(self._reindex(project, identifier))
+        self.reindexing[identifier] = task
+        task.add_done_callback(lambda _: self.reindexing.pop(identifier, None))
+
+    async def _reindex(
+            self,
+            project: Project,
+            identifier: str
+    ) -> None:
+        background.set(True)
+        try:
+            stat = os.stat(identifier)
+        except OSError:
+            project.remove_content(identifier)
+            project.manifest.pop(identifier, None)
+            logger.info(f"Removed '{identifier}' from the index, it no longer exists.")
+            return
+
+        _, content = await project._read_file(identifier)
+        line_ranges, embeddings = await self._embed_chunks(content)
+        project._index_content(identifier, content, embeddings, content_type="file", line_ranges=line_ranges)
+        digest = content_digest(content)
+        if identifier in project.manifest:
+            project.manifest[identifier] = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "hash": digest}
+        self._queue_summary(project, identifier, digest)
+        logger.info(f"Indexed '{identifier}' again after it changed on disk.")
 
     async def add_terminal_output(
             self, 
@@ -263,30 +712,93 @@ class HistoryManager:
             summary (str): A summarized explanation of the output.
         """
         terminal_content = f"Command: {command}\nOutput: {output}\nSummary: {summary}"
-        terminal_embedding = await self.fetch_embedding(terminal_content)
+        line_ranges, embeddings = await self._embed_chunks(terminal_content)
 
         # Generate a unique identifier for terminal output storage
         terminal_id = f"terminal_{hash(command + datetime.now().isoformat())}"
         
         # Store the terminal output using the unified indexing method
-        self.current_project._index_content(terminal_id, terminal_content, terminal_embedding, content_type="terminal")
+        self.current_project._index_content(terminal_id, terminal_content, embeddings, content_type="terminal", line_ranges=line_ranges)
         
         logger.info(f"Stored terminal output for command: {command}")
 
+    async def _embed_chunks(
+            self,
+            content: str
+    ) -> tuple[list[tuple[int, int]], list[np.ndarray]]:
+        """
+        Splits content into line windows and embeds every window.
+        Only the text is embedded, so identical chunks under different paths or
+        commands hit the embedding cache; the lexical index covers their names.
+
+        Returns:
+            tuple: The (first line, last line) ranges and the matching embeddings.
+        """
+        chunks = Project.split_chunks(content)
+        line_ranges = [(start, end) for start, end, _ in chunks]
+        embeddings = await self.fetch_embeddings([text for _, _, text in chunks])
+        return line_ranges, embeddings
+
+    async def _summarize_files(self) -> None:
+        """
+        Summarizes queued files with the helper model, one at a time, in the background.
+        Summaries are cached by content hash, so unchanged files are never summarized twice.
+        A file stays queued until its summary is stored, so a cancelled or paused run resumes with it.
+        """
+        input_budget = MODE_CONFIGS[Mode.HELPER]["budget"]
+        while self.summary_queue:
+            digest, (project, identifier) = next(iter(self.summary_queue.items()))
+            info = project.file_embeddings.get(identifier)
+            if info is None or info["digest"] != digest:
+                # Removed or changed since it was queued
+                self.summary_queue.pop(digest, None)
+                continue
+            summary = self.summary_store.get(digest)
+            if summary is not None:
+                # Summarized since it was queued (e.g. the same content under another path)
+                project.summaries[identifier] = summary
+                self.summary_queue.pop(digest, None)
+                continue
+
+            content = await project.get_content(identifier)
+            response = await self.helper(PromptHelper.analyze_code(truncate_to_tokens(content, input_budget)), True)
+            self.summary_queue.pop(digest, None)
+            if not response or response in ("Error fetching response", "No message in response"):
+                logger.warning(f"Could not summarize '{identifier}'.")
+                continue
+
+            summary = truncate_to_tokens(response.strip(), SUMMARY_TOKENS)
+            self.summary_store.put(digest, summary)
+            if project.file_embeddings.get(identifier, {}).get("digest") == digest:
+                project.summaries[identifier] = summary
+            logger.info(f"Stored summary of '{identifier}' ({len(self.summary_queue)} files left).")
+
+    def file_summaries(
+            self,
+            project: Project
+    ) -> dict[str, str]:
+        """
+        Returns the summaries of the project's files. They are kept on the project as files
+        are indexed and summarized, so building a prompt does not query the summary store.
+        """
+        return dict(project.summaries)
+
     def add_folder_structure(
             self, 
-            structure: dict
+            structure: dict,
+            root: str | None = None
     ) -> None:
         """
         Adds or updates folder structure for the current project.
         If a structure already exists, archives the current project by adding it
-        to the projects list (if not already present) before updating.
+        to the projects list (if not already present) and starts a new project.
         Also, if the current project's name is empty or 'Unsorted', assigns the new folder name.
         """
         if self.current_project.folder_structure:
             if self.current_project not in self.projects:
                 self.projects.append(self.current_project)
                 logger.info(f"Archived project '{self.current_project.name}' to projects list.")
+            self.current_project = Project(blobs=self.blobs)
 
         if not self.current_project.name or self.current_project.name.lower() == "unsorted":
             if isinstance(structure, dict) and len(structure) == 1:
@@ -295,8 +807,67 @@ class HistoryManager:
                 logger.info(f"Assigned new project name '{new_name}' from folder structure.")
 
         self.current_project.folder_structure = structure
+        if root:
+            self.current_project.root = os.path.realpath(root)
         logger.info(f"Folder structure updated for project '{self.current_project.name}'.")
 
+    def sync_folder(
+            self,
+            folder_path: str,
+            stats: dict[str, tuple[int, int]]
+    ) -> list[str] | None:
+        """
+        Reconciles a folder that is opened again with the manifest of its project.
+        Deleted files are dropped from the index, the folder structure is patched in place
+        and the stats of new or modified files are recorded. Manifest paths are kept under the
+        resolved folder path, so the folder matches however it is opened (relative path, symlink).
+
+        Args:
+            folder_path (str): The opened folder.
+            stats (dict): File path -> (size, mtime) of every file in the folder.
+
+        Returns:
+            list[str] | None: Paths (under the resolved folder) that need to be read and indexed again,
+            or None if no project has been created for the folder yet.
+        """
+        root = os.path.realpath(folder_path)
+        project = next(
+            (p for p in [self.current_project, *self.projects] if p.root and os.path.realpath(p.root) == root),
+            None
+        )
+        if project is None:
+            return None
+        stats = {os.path.join(root, os.path.relpath(path, folder_path)): stat for path, stat in stats.items()}
+
+        if project is not self.current_project:
+            if self.current_project.name.lower() != "unsorted" and self.current_project not in self.projects:
+                self.projects.append(self.current_project)
+                logger.info(f"Archived project '{self.current_project.name}' to projects list.")
+            self.current_project = project
+            logger.info(f"Switched to project '{project.name}'.")
+
+        # Without a manifest the structure was just generated from this folder, there is nothing to patch
+        generated = not project.manifest
+
+        removed = [path for path in project.manifest if path not in stats]
+        for path in removed:
+            project.remove_content(path)
+            del project.manifest[path]
+
+        added = [path for path in stats if path not in project.manifest]
+        if (added or removed) and not generated:
+            self.file_utils.patch_structure(project.folder_structure, root, added, removed)
+
+        changed = []
+        for path, (size, mtime) in stats.items():
+            entry = project.manifest.get(path)
+            if entry is None or entry["size"] != size or entry["mtime"] != mtime:
+                project.manifest[path] = {"size": size, "mtime": mtime, "hash": entry["hash"] if entry else None}
+                changed.append(path)
+
+        logger.info(f"Project '{project.name}': {len(changed)} changed, {len(removed)} removed files.")
+        return changed
+
     def format_structure(
             self, 
             folder_structure: dict
@@ -362,76 +933,188 @@ class HistoryManager:
             self, 
             query: str, 
             content_type: Optional[str] = None, 
-            top_k: int = 1, 
+            top_k: int = TOP_K_CHUNKS, 
             similarity_threshold: float = CONT_THR
     ) -> list | None:
         """
-        Retrieves relevant content (files or terminal outputs) by comparing the query
-        against the stored embeddings.
+        Retrieves relevant chunks of content (files or terminal outputs). Chunks are ranked by
+        cosine similarity fused with their BM25 score; queries naming a symbol that occurs in the
+        index are answered from the lexical index alone, without an embedding call.
+        Overlapping chunks of the same content are merged.
         
         Args:
             query (str): The user query.
             content_type (str, optional): Type of content to filter by (e.g., "file" or "terminal").
-            top_k (int): Maximum number of results.
+            top_k (int): Maximum number of chunks.
             similarity_threshold (float): Minimum similarity score to consider.
         
         Returns:
-            list: A list of tuples (identifier, content) for the top matching entries.
+            list: A list of dicts (identifier, content, type, lines, score) for the top matching chunks.
         """
-        query_embedding = await self.fetch_embedding(query)
-        scores = []
+        query_embedding = None
+        scores: dict[str, float] = {}
+        project = self.current_project
+
+        symbols = project.lexical.match_symbols(query)
+        if symbols:
+            lexical = self._lexical_scores(project, query, content_type, symbols)
+            logger.info(f"Exact symbol match on {symbols}, skipping the embedding lookup.")
+        else:
+            query_embedding = await self.fetch_embedding(query)
+            lexical = self._lexical_scores(project, query, content_type)
 
         # Optionally extract a file name only if querying for files.
         file_name = self.extract_file_name_from_query(query) if content_type in (None, "file") else None
 
-        # Iterate over all stored content
-        for identifier, info in self.current_project.file_embeddings.items():
-            # Filter by type if specified
-            if content_type and info.get("type") != content_type:
-                continue
-
-            # If querying a file, try an exact match on identifier if available.
-            if file_name and info.get("type") == "file":
-                if file_name.lower() in info.get("identifier", "").lower():
-                    scores.append((identifier, 1.0))
+        # If querying a file, rank the chunks of files matching the name above everything else.
+        if file_name:
+            for identifier, info in project.file_embeddings.items():
+                if info.get("type") == "file" and file_name.lower() in identifier.lower():
+                    if query_embedding is None:
+                        for chunk_id in info["chunks"]:
+                            scores[chunk_id] = 1.0 + lexical.get(chunk_id, 0.0)
+                    else:
+                        for chunk_id, similarity in project.score_chunks(query_embedding, info["chunks"]):
+                            scores[chunk_id] = 1.0 + similarity
                     logger.info(f"Added file '{identifier}' to context (Exact match on file name).")
-                    continue
 
-            similarity = cosine_similarity([query_embedding], [info["embedding"]])[0][0]
-            if similarity >= similarity_threshold:
-                scores.append((identifier, similarity))
-                logger.info(f"Added file '{identifier}' to context (Similarity: {similarity}).")
+        if query_embedding is None:
+            for chunk_id, score in sorted(lexical.items(), key=lambda x: x[1], reverse=True)[:top_k]:
+                if chunk_id not in scores:
+                    scores[chunk_id] = 1.0 + score
+                    logger.info(f"Added chunk '{chunk_id}' to context (BM25: {score}).")
+        else:
+            for chunk_id, score in self._hybrid_search(
+                project, query_embedding, lexical, content_type, top_k, similarity_threshold
+            ):
+                if chunk_id not in scores:
+                    scores[chunk_id] = score
+                    logger.info(f"Added chunk '{chunk_id}' to context (Score: {score}).")
+
+        candidates = [(score, project, chunk_id) for chunk_id, score in scores.items()]
 
         # Expand search to other projects if necessary (similar to your current logic)
-        if not scores:
+        if not candidates:
             logger.info("No relevant content in the current project; searching across all projects.")
-            for project in self.projects:
-                for identifier, info in project.file_embeddings.items():
-                    if content_type and info.get("type") != content_type:
-                        continue
-                    similarity = cosine_similarity([query_embedding], [info["embedding"]])[0][0]
-                    if similarity >= similarity_threshold:
-                        scores.append((identifier, similarity))
-                        logger.info(f"Added file '{identifier}' from project '{project.name}' to context (Similarity: {similarity}).")
-
-        if scores:
-            scores.sort(key=lambda x: x[1], reverse=True)
-            selected_ids = [id for id, _ in scores[:top_k]]
-            results = []
-            for id in selected_ids:
-                # Try to retrieve the content from the current project first.
-                if id in self.current_project.file_embeddings and "content" in self.current_project.file_embeddings[id]:
-                    results.append((id, self.current_project.file_embeddings[id]["content"]))
-                    logger.info(f"Added content from file '{id}' to results.")
+            if query_embedding is None:
+                query_embedding = await self.fetch_embedding(query)
+            for other in self.projects:
+                lexical = self._lexical_scores(other, query, content_type)
+                for chunk_id, score in self._hybrid_search(
+                    other, query_embedding, lexical, content_type, top_k, similarity_threshold
+                ):
+                    candidates.append((score, other, chunk_id))
+                    logger.info(f"Added chunk '{chunk_id}' from project '{other.name}' to context (Score: {score}).")
+
+        if not candidates:
+            logger.info("No matching content found.")
+            return None
+
+        candidates.sort(key=lambda x: x[0], reverse=True)
+
+        # Group the selected chunks per content, so overlapping windows can be merged.
+        # Chunks with the same text as a better one (duplicated content) are skipped.
+        selected: dict[tuple[int, str], list] = {}
+        seen_rows = set()
+        for score, project, chunk_id in candidates:
+            if len(seen_rows) == top_k:
+                break
+            row = project.chunk_rows[chunk_id]
+            if row in seen_rows:
+                logger.info(f"Skipped chunk '{chunk_id}' (duplicate content).")
+                continue
+            seen_rows.add(row)
+            identifier, start, end = project.chunks[chunk_id]
+            selected.setdefault((id(project), identifier), []).append((start, end, score, project))
+
+        results = []
+        for (_, identifier), ranges in selected.items():
+            ranges.sort(key=lambda x: x[0])
+            merged = [list(ranges[0])]
+            for start, end, score, project in ranges[1:]:
+                if start <= merged[-1][1] + 1:
+                    merged[-1][1] = max(merged[-1][1], end)
+                    merged[-1][2] = max(merged[-1][2], score)
                 else:
-                    _, content = await self.current_project._read_file(id)
-                    results.append((id, content))
-                    logger.info(f"Added content from file '{id}' to results (Read from file path).")
-            return results
+                    merged.append([start, end, score, project])
 
-        logger.info("No matching content found.")
-        return None
+            for start, end, score, project in merged:
+                content = await project.get_lines(identifier, start, end)
+                if content is None:
+                    logger.info(f"Dropped lines {start}-{end} of '{identifier}' (changed on disk).")
+                    self._reindex_later(project, identifier)
+                    continue
+                results.append({
+                    "identifier": identifier,
+                    "content": content,
+                    "type": project.file_embeddings.get(identifier, {}).get("type", "content"),
+                    "lines": (start, end),
+                    "score": score
+                })
+                logger.info(f"Added lines {start}-{end} of '{identifier}' to results.")
+
+        results.sort(key=lambda x: x["score"], reverse=True)
+        return results
+
+
+    @staticmethod
+    def _lexical_scores(
+            project: Project,
+            query: str,
+            content_type: Optional[str] = None,
+            required: list[str] | None = None
+    ) -> dict[str, float]:
+        """
+        Returns the BM25 scores of the project's chunks, scaled so the best chunk scores 1.0.
+        """
+        scores = project.lexical.score(query, required=required)
+        if content_type:
+            scores = {
+                chunk_id: score for chunk_id, score in scores.items()
+                if project.file_embeddings.get(project.chunks[chunk_id][0], {}).get("type") == content_type
+            }
+        if not scores:
+            return {}
+        best = max(scores.values())
+        return {chunk_id: score / best for chunk_id, score in scores.items()}
+
+    @staticmethod
+    def _hybrid_search(
+            project: Project,
+            query_embedding: np.ndarray,
+            lexical: dict[str, float],
+            content_type: Optional[str],
+            top_k: int,
+            similarity_threshold: float
+    ) -> list[tuple[str, float]]:
+        """
+        Fuses cosine similarity with the scaled BM25 scores. The best chunks of either
+        ranking are rescored, so a strong lexical match is found even when its
+        embedding alone falls below the threshold.
 
+        Returns:
+            list[tuple[str, float]]: Up to top_k (chunk id, fused score) pairs sorted by score.
+        """
+        pool = top_k * 2
+        semantic = project.search_chunks(query_embedding, pool, similarity_threshold, content_type)
+        candidates = {chunk_id for chunk_id, _ in semantic}
+        candidates.update(sorted(lexical, key=lexical.get, reverse=True)[:pool])
+
+        fused = [
+            (chunk_id, similarity + HYBRID_WEIGHT * lexical.get(chunk_id, 0.0))
+            for chunk_id, similarity in project.score_chunks(query_embedding, list(candidates))
+        ]
+        fused = [(chunk_id, score) for chunk_id, score in fused if score >= similarity_threshold]
+        fused.sort(key=lambda x: x[1], reverse=True)
+
+        # Keep the best chunk of every distinct text
+        rows = set()
+        unique = []
+        for chunk_id, score in fused:
+            if project.chunk_rows[chunk_id] not in rows:
+                rows.add(project.chunk_rows[chunk_id])
+                unique.append((chunk_id, score))
+        return unique[:top_k]
 
     async def fetch_embedding(
             self, 
@@ -439,20 +1122,124 @@ class HistoryManager:
     ) -> np.ndarray: 
         """
         Asynchronously fetches and caches an embedding for the given text.
-        Uses async lock to guard the caching mechanism.
+        The persistent embedding store is checked before any network call;
+        misses are micro-batched with concurrent callers into one request.
         """
-        async with asyncio.Lock():
-            if text in self.embedding_cache:
-                return self.embedding_cache[text]
-
-        embedding = await self.tasker(OllamaClient.fetch_embedding, text)
+        digest = content_digest(text)
+        cached = self.embedding_cache.get(digest)
+        if cached is not None:
+            return cached
+
+        if self.embedding_store:
+            stored = self.embedding_store.get(digest)
+            if stored is not None:
+                self.embedding_cache.put(digest, stored)
+                return stored
+
+        embedding = await self.embedding_batcher.embed(text)
         if embedding:
-            self.embedding_cache[text] = embedding
+            embedding = np.asarray(embedding, dtype=np.float32)
+            self.embedding_cache.put(digest, embedding)
+            if self.embedding_store:
+                self.embedding_store.put(digest, embedding)
             logger.debug(f"Extracted {len(embedding)} embeddings")
             return embedding
         else:
             return np.array([])
        
+    async def fetch_embeddings(
+            self,
+            texts: list[str]
+    ) -> list[np.ndarray]:
+        """
+        Fetches embeddings for several texts concurrently, so cache misses
+        are sent upstream together.
+        """
+        return list(await asyncio.gather(*(self.fetch_embedding(text) for text in texts)))
+
+    def save_session(self) -> None:
+        """
+        Saves topics, histories, projects and their embedding matrices to the session store.
+        """
+        if not self.session_store:
+            return
+
+        arrays: dict[str, np.ndarray] = {}
+        topics = self.topics if self.current_topic in self.topics else [*self.topics, self.current_topic]
+        projects = self.projects if self.current_project in self.projects else [*self.projects, self.current_project]
+
+        state = {
+            "topics": [topic.to_state(f"topic_{i}", arrays) for i, topic in enumerate(topics)],
+            "listed_topics": [topic.uid for topic in self.topics],
+            "current_topic": self.current_topic.uid,
+            "projects": [project.to_state(f"project_{i}", arrays) for i, project in enumerate(projects)],
+            "blobs": self.blobs.to_state({
+                info["digest"] for project in projects
+                for info in project.file_embeddings.values() if info["type"] != "file"
+            }),
+            "archived_projects": [i for i, project in enumerate(projects) if project in self.projects],
+            "current_project": projects.index(self.current_project)
+        }
+        self.session_store.save(state, arrays)
+
+    def restore_session(self) -> None:
+        """
+        Restores the last saved session. Embedding matrices are memory-mapped, not read.
+        """
+        if not self.session_store:
+            return
+
+        loaded = self.session_store.load()
+        if not loaded:
+            return
+        state, arrays = loaded
+
+        try:
+            topics = [
+                Topic.from_state(topic_state, arrays, f"topic_{i}")
+                for i, topic_state in enumerate(state["topics"])
+            ]
+            blobs = BlobStore.from_state(state["blobs"])
+            projects = [Project.from_state(project_state, arrays, blobs) for project_state in state["projects"]]
+        except (KeyError, TypeError, ValueError) as e:
+            logger.error(f"Saved session is not compatible, starting a new one: {e}")
+            return
+
+        listed = set(state["listed_topics"])
+        self.topics = [topic for topic in topics if topic.uid in listed]
+        self.current_topic = next(topic for topic in topics if topic.uid == state["current_topic"])
+        for topic in self.topics:
+            self._index_topic(topic)
+
+        self.blobs = blobs
+        self.projects = [projects[i] for i in state["archived_projects"]]
+        self.current_project = projects[state["current_project"]]
+        logger.info(f"Restored {len(topics)} topics and {len(projects)} projects from the last session.")
+
+    def close(self) -> None:
+        """
+        Releases resources held by the history manager.
+        """
+        logger.info(f"Embedding cache stats: {self.embedding_cache.stats()}")
+        stop_training()
+        if self.embedding_store:
+            self.embedding_store.close()
+        if self.summary_store:
+            self.summary_store.close()
+
+    def _index_topic(
+            self,
+            topic: Topic
+    ) -> None:
+        """
+        Stores the normalized description embedding of a listed topic in the shared topic matrix.
+        Called whenever a topic joins the topics list or its description changes.
+        """
+        if topic not in self.topics or len(topic.embedded_description) == 0:
+            return
+        self.topic_lookup[topic.uid] = topic
+        self.topic_index.add(topic.uid, topic.embedded_description)
+
     async def switch_topic(
             self,
             topic: Topic
@@ -461,6 +1248,7 @@ class HistoryManager:
             if topic.name != self.current_topic.name:
                 if not any(t.name == self.current_topic.name for t in self.topics):
                     self.topics.append(self.current_topic)
+                    self._index_topic(self.current_topic)
                 logger.info(f"Switched to {topic.name}")
                 self.current_topic = topic
 
@@ -471,7 +1259,7 @@ class HistoryManager:
     ) -> Topic | None:
         """
         Matches a message or file embedding to the most similar topic based on the description embedding,
-        optionally excluding a specified topic.
+        optionally excluding a specified topic. All descriptions are scored with one vector-matrix product.
 
         Args:
             embedding (np.ndarray): The embedding to match.
@@ -484,29 +1272,20 @@ class HistoryManager:
             logger.info("No topics available for matching. Returning None.")
             return None
 
-        async def compute_similarity(topic: Topic) -> tuple[float, Topic]:
-            if len(topic.embedded_description) == 0 or len(embedding) == 0:
-                return 0.0, topic
-            similarity = cosine_similarity([embedding], [topic.embedded_description])[0][0]
-            logger.debug(f"Computed similarity {similarity:.4f} for topic '{topic.name}'")
-            return similarity, topic
-
-        tasks = [compute_similarity(topic) for topic in self.topics if topic != exclude_topic]
-        results = await asyncio.gather(*tasks)
-        
-        best_topic = None
-        best_similarity = 0.0
-        for similarity, topic in results:
-            if similarity > best_similarity and similarity >= self.similarity_threshold:
-                best_similarity = similarity
-                best_topic = topic
-
-        if best_topic:
-            logger.info(f"Best matching topic: '{best_topic.name}' with similarity {best_similarity:.4f}")
-            return best_topic
-        else:
-            logger.info("No suitable topic found.")
+        if len(embedding) == 0:
             return None
+
+        excluded = exclude_topic.uid if exclude_topic else None
+        matches = self.topic_index.search(embedding, 2, self.similarity_threshold)
+
+        for uid, similarity in matches:
+            if uid != excluded and similarity > 0.0:
+                best_topic = self.topic_lookup[uid]
+                logger.info(f"Best matching topic: '{best_topic.name}' with similarity {similarity:.4f}")
+                return best_topic
+
+        logger.info("No suitable topic found.")
+        return None
     
     async def generate_prompt(
             self, 
@@ -524,45 +1303,105 @@ class HistoryManager:
         Returns:
             list: The last few messages from the topic's history.
         """
-        embedding = await self.fetch_embedding(query)
-        
-        # Determine the best matching topic and switch to it if found.
-        current_topic = await self._match_topic(embedding)
-        if current_topic:
-            await self.switch_topic(current_topic)
-        
         # Retrieve the project folder structure if the query contains a folder name/path.
         project = self.find_project_structure(query)
         if project:
             self.current_project = project
 
+        # The query embedding is only needed for topic matching and the history. A query naming an
+        # indexed symbol is answered from the lexical index and continues the current topic, so its
+        # embedding is fetched after the prompt is returned. Other queries fetch it while content
+        # is retrieved (retrieval depends on the project, not the topic).
+        deferred = bool(self.current_project.lexical.match_symbols(query))
+        embedding_task = None if deferred else asyncio.create_task(self.fetch_embedding(query))
+
         # Retrieve all types of content unless a filter is specified.
         relevant_content = await self.get_relevant_content(query)
-        content_references = ""
-        
+        structure = ""
+        summaries = {}
         if relevant_content:
+            summaries = self.file_summaries(self.current_project)
             if self.current_project.folder_structure:
-                content_references += (
-                    f"Folder structure:\n{self.format_structure(self.current_project.folder_structure)}\n"
-                )
-            # Iterate through each retrieved content item.
-            for identifier, content in relevant_content:
-                # Attempt to determine the content type (default to generic "Content").
-                content_type = self.current_project.file_embeddings.get(identifier, {}).get("type", "content")
-                if content_type == "file":
-                    label = "Referenced File"
-                elif content_type == "terminal":
-                    label = "Referenced Terminal Output"
-                else:
-                    label = "Referenced Content"
-                content_references += f"\n[{label}: {identifier}]\n{content}\n"
-        
-        prompt = f"{content_references}\nUser query: {query}" if content_references else query
+                structure = self.format_structure(self.current_project.folder_structure)
+
+        # Fit structure, retrieved chunks, summaries and history into the token budget of the mode.
+        builder = PromptBuilder(MODE_CONFIGS.get(self.client.mode, MODE_CONFIGS[Mode.DEFAULT])["budget"])
+        prompt = builder.build_references(query, structure, relevant_content or [], summaries)
 
         logger.debug(f"Generated prompt: {prompt}") 
-        await self.add_message("user", prompt, embedding)
-        
-        return self.current_topic.history[-num_messages:]
+
+        if deferred:
+            topic = self.current_topic
+            history = self._prefix_window(topic, builder, estimate_tokens(prompt), num_messages, topic.history)
+            self.pending_message = asyncio.create_task(self._add_query(topic, query))
+            return history + [{"role": "user", "content": prompt}]
+
+        # Determine the best matching topic and switch to it if found.
+        embedding = await embedding_task
+        current_topic = await self._match_topic(embedding)
+        if current_topic:
+            await self.switch_topic(current_topic)
+
+        # The history keeps the bare query; retrieved content only goes into the last message,
+        # so earlier turns stay byte-identical and form a stable prefix.
+        await self.add_message("user", query, embedding)
+
+        history = self._prefix_window(self.current_topic, builder, estimate_tokens(prompt), num_messages)
+        return history + [{"role": "user", "content": prompt}]
+
+    async def _add_query(
+            self,
+            topic: Topic,
+            query: str
+    ) -> None:
+        """
+        Adds a query whose prompt was built without its embedding to the topic it was asked in.
+        """
+        embedding = await self.fetch_embedding(query)
+        await topic.add_message("user", query, embedding)
+        self.analysis.trigger()
+
+    def _prefix_window(
+            self,
+            topic: Topic,
+            builder: PromptBuilder,
+            used_tokens: int,
+            num_messages: int,
+            history: list[dict] | None = None
+    ) -> list[dict]:
+        """
+        Returns the history sent before the new message. The window starts at a fixed
+        message and only grows, so consecutive prompts share their prefix and the server
+        can reuse the KV cache of the previous turn. It moves forward to the last
+        `num_messages` messages once it grows past twice that, and to half of the
+        history budget once it no longer fits.
+
+        Args:
+            topic (Topic): The topic whose last message is the new query.
+            builder (PromptBuilder): The builder holding the token budget.
+            used_tokens (int): Tokens of the new message.
+            num_messages (int): Number of recent messages kept when the window moves.
+            history (list, optional): The messages before the new one, if it was not added yet.
+
+        Returns:
+            list: The history window.
+        """
+        if history is None:
+            history = topic.history[:-1]
+        start = min(topic.prefix_start, len(history))
+        if len(history) - start > 2 * num_messages:
+            start = max(len(history) - num_messages, 0)
+
+        window = history[start:]
+        fitted = builder.fit_history(window, used_tokens)
+        if len(fitted) < len(window):
+            window = builder.fit_history(window, (builder.budget + used_tokens) // 2)
+            start = len(history) - len(window)
+
+        if start != topic.prefix_start:
+            logger.info(f"History window of '{topic.name}' moved to message {start}.")
+        topic.prefix_start = start
+        return window
 
     async def generate_topic_info_from_history(
             self,
@@ -586,7 +1425,8 @@ class HistoryManager:
         while attempt < max_retries:
             await asyncio.sleep(1)
             try:
-                response = await self.helper(PromptHelper.topics_helper(history),True)
+                # Retries must not get the same (cached) unparseable answer again
+                response = await self.helper(PromptHelper.topics_helper(history), True, attempt > 0)
                 if not response:
                     logger.warning("Received empty response from the helper.")
                 
@@ -601,6 +1441,7 @@ class HistoryManager:
                     return extracted_topic_name, extracted_topic_description
                 else:
                     logger.warning("Could not extract valid topic information.")
+                    attempt += 1
             except Exception as e:
                 logger.error(f"Analyze history attempt {attempt + 1} failed: {str(e)}", exc_info=True)
                 attempt += 1
@@ -619,7 +1460,8 @@ class HistoryManager:
     ) -> None:
         """
         Analyzes the current topic's history for potential off-topic drift.
-        When the history length reaches a multiple of `off_topic_frequency`, the method:
+        Runs in the background through the analysis scheduler.
+        When `off_topic_frequency` messages were added since the last analysis, the method:
           1. Takes a slice of the last `slice_size` messages and computes per-message similarity to the current topic.
           2. If more than half of the messages in the slice have a similarity below `off_topic_threshold`,
              it determines the precise start of the off-topic segment.
@@ -628,18 +1470,23 @@ class HistoryManager:
              a new topic is created.
           4. Finally, the off-topic messages are removed from the current topic.
         """
+        topic = self.current_topic
+
         # If the current topic is unnamed but has > 4 messages, generate a topic name/description.
-        if len(self.current_topic.history) > 4 and not self.current_topic.description.strip():
-            new_topic_name, new_topic_desc = await self.generate_topic_info_from_history(self.current_topic.history)
+        if len(topic.history) > 4 and not topic.description.strip():
+            new_topic_name, new_topic_desc = await self.generate_topic_info_from_history(topic.history)
             if new_topic_name and new_topic_desc:
-                self.current_topic.name = new_topic_name
-                self.current_topic.description = new_topic_desc
-                self.current_topic.embedded_description = await self.fetch_embedding(new_topic_desc)
+                embedded_description = await self.fetch_embedding(new_topic_desc)
+                topic.name = new_topic_name
+                topic.description = new_topic_desc
+                topic.embedded_description = embedded_description
+                self._index_topic(topic)
                 return
 
-        # Trigger analysis when history length is a multiple of off_topic_frequency.
-        if (len(self.current_topic.history) >= off_topic_frequency and 
-            len(self.current_topic.history) % off_topic_frequency == 0):
+        # Trigger analysis when off_topic_frequency messages were added since the last one.
+        history_size = len(topic.history)
+        if (history_size >= off_topic_frequency and
+            history_size - min(topic.analyzed_size, history_size) >= off_topic_frequency):
             logger.info("Analyzing current topic for potential off-topic segments.")
 
             current_name = self.current_topic.name
@@ -648,9 +1495,7 @@ class HistoryManager:
             candidate_slice = self.current_topic.history[-slice_size:]
             
             # Concurrently fetch embeddings for the candidate slice.
-            candidate_embeddings = await asyncio.gather(
-                *(self.fetch_embedding(msg["content"]) for msg in candidate_slice)
-            )
+            candidate_embeddings = await self.fetch_embeddings([msg["content"] for msg in candidate_slice])
             
             similarities = []
             for msg_emb in candidate_embeddings:
@@ -676,12 +1521,17 @@ class HistoryManager:
                 if candidate_topic_name and candidate_topic_desc:
                     candidate_embedding = await self.fetch_embedding(candidate_topic_desc)
                     matched_topic = await self._match_topic(candidate_embedding, exclude_topic=self.current_topic)
+                    segment_embeddings = await self.fetch_embeddings([msg["content"] for msg in off_topic_segment])
+
+                    # Messages may have arrived while the helper was busy; the next run sees them.
+                    if self.current_topic is not topic or len(topic.history) != history_size:
+                        logger.info("History changed during analysis, discarding the result.")
+                        return
+
                     if matched_topic is not None:
                         logger.info("Matched topic found")
                         # Reassign off-topic messages to the matched topic.
-                        for msg in off_topic_segment:
-                            msg_emb = await self.fetch_embedding(msg["content"])
-                            
+                        for msg, msg_emb in zip(off_topic_segment, segment_embeddings):
                             await matched_topic.add_message(msg["role"], msg["content"], msg_emb)
                         logger.info(f"Reassigned off-topic segment of {len(off_topic_segment)} messages to existing topic "
                                     f"'{matched_topic.name}'.")
@@ -693,9 +1543,7 @@ class HistoryManager:
                             logger.info("Creating new topic from the off-topic content")
                             new_topic = Topic(candidate_topic_name, candidate_topic_desc)
                             new_topic.embedded_description = candidate_embedding
-                            for msg in off_topic_segment:
-                                msg_emb = await self.fetch_embedding(msg["content"])
-                                
+                            for msg, msg_emb in zip(off_topic_segment, segment_embeddings):
                                 await new_topic.add_message(msg["role"], msg["content"], msg_emb)
 
                             await self.switch_topic(new_topic)
@@ -709,12 +1557,15 @@ class HistoryManager:
                         target_topic = next((topic for topic in self.topics if topic.name == current_name), None)
                         if target_topic:
                             async with asyncio.Lock():
-                                target_topic.history = target_topic.history[:off_topic_start_index]
+                                target_topic.truncate(off_topic_start_index)
+                                # The generate context still holds the moved messages
+                                self.client.forget_context(target_topic.uid)
                                 logger.info("Removed off-topic from the current topic")                            
 
                 else:
                     logger.warning("Could not generate candidate topic info from the off-topic segment.")
             else:
                 logger.info("Candidate slice does not appear off-topic; no splitting performed.")
+            topic.analyzed_size = history_size
 
         return   
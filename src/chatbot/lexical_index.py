@@ -0,0 +1,245 @@
+import re
+import math
+import numpy as np
+from collections import Counter
+from utils.logger import Logger
+
+logger = Logger.get_logger()
+
+WORD_PATTERN = re.compile(r"[A-Za-z_][A-Za-z0-9_]*|\d+")
+CAMEL_PATTERN = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|\d+")
+
+
+def tokenize(
+        text: str
+) -> list[str]:
+    """
+    Splits text into lowercase terms. Identifiers are kept whole and also
+    split into their snake_case and camelCase parts, so both
+    `fetch_embedding` and `embedding` find the same chunk.
+    """
+    terms = []
+    for word in WORD_PATTERN.findall(text):
+        lowered = word.lower()
+        terms.append(lowered)
+        parts = [part.lower() for piece in word.split("_") for part in CAMEL_PATTERN.findall(piece)]
+        if len(parts) > 1:
+            terms.extend(part for part in parts if part != lowered)
+    return terms
+
+
+def is_symbol(
+        word: str
+) -> bool:
+    """
+    True for identifier-like words: snake_case, camelCase, CONSTANT_CASE or letters mixed with digits.
+    """
+    return (
+        "_" in word.strip("_")
+        or bool(re.search(r"[a-z][A-Z]", word))
+        or (bool(re.search(r"\d", word)) and bool(re.search(r"[A-Za-z]", word)))
+    )
+
+
+def _join(
+        strings: list[str]
+) -> np.ndarray:
+    """
+    Packs strings into one NUL separated UTF-8 byte array.
+    """
+    return np.frombuffer("\0".join(strings).encode("utf-8"), dtype=np.uint8)
+
+
+def _split(
+        packed: np.ndarray
+) -> list[str]:
+    """
+    Unpacks a byte array built by _join.
+    """
+    return bytes(packed).decode("utf-8").split("\0") if len(packed) else []
+
+
+class LexicalIndex:
+    """
+    Incremental inverted index with BM25 scoring.
+    """
+
+    def __init__(
+            self,
+            k1: float = 1.2,
+            b: float = 0.75
+    ) -> None:
+
+        self.k1 = k1
+        self.b = b
+        self.postings: dict[str, dict[str, int]] = {}
+        self.doc_lengths: dict[str, int] = {}
+        self.doc_terms: dict[str, list[str]] = {}
+        self.total_length = 0
+        # Postings restored from a saved session, unpacked on first use
+        self.saved: dict[str, np.ndarray] | None = None
+
+    def __len__(self) -> int:
+        self._unpack()
+        return len(self.doc_lengths)
+
+    def add(
+            self,
+            doc_id: str,
+            text: str
+    ) -> None:
+        """
+        Adds or replaces a document.
+        """
+        self._unpack()
+        self.remove(doc_id)
+        counts = Counter(tokenize(text))
+        for term, frequency in counts.items():
+            self.postings.setdefault(term, {})[doc_id] = frequency
+        length = sum(counts.values())
+        self.doc_terms[doc_id] = list(counts)
+        self.doc_lengths[doc_id] = length
+        self.total_length += length
+
+    def remove(
+            self,
+            doc_id: str
+    ) -> None:
+        self._unpack()
+        length = self.doc_lengths.pop(doc_id, None)
+        if length is None:
+            return
+        self.total_length -= length
+        for term in self.doc_terms.pop(doc_id, []):
+            documents = self.postings.get(term, {})
+            documents.pop(doc_id, None)
+            if not documents:
+                self.postings.pop(term, None)
+
+    def match_symbols(
+            self,
+            query: str
+    ) -> list[str]:
+        """
+        Returns the identifier-like words of the query that occur verbatim in the index.
+        """
+        self._unpack()
+        return [
+            word.lower() for word in WORD_PATTERN.findall(query)
+            if is_symbol(word) and word.lower() in self.postings
+        ]
+
+    def score(
+            self,
+            query: str,
+            doc_ids: list[str] | None = None,
+            required: list[str] | None = None
+    ) -> dict[str, float]:
+        """
+        Computes BM25 scores of the query.
+
+        Args:
+            query (str): The query text.
+            doc_ids (list, optional): Only score these documents.
+            required (list, optional): Only score documents containing one of these terms.
+
+        Returns:
+            dict[str, float]: Document id -> BM25 score for documents matching any term.
+        """
+        self._unpack()
+        if not self.doc_lengths:
+            return {}
+
+        allowed = set(doc_ids) if doc_ids is not None else None
+        if required:
+            containing = {doc_id for term in required for doc_id in self.postings.get(term, {})}
+            allowed = containing if allowed is None else allowed & containing
+
+        count = len(self.doc_lengths)
+        average_length = self.total_length / count if count else 0.0
+        scores: dict[str, float] = {}
+
+        for term in set(tokenize(query)):
+            documents = self.postings.get(term)
+            if not documents:
+                continue
+            idf = math.log(1 + (count - len(documents) + 0.5) / (len(documents) + 0.5))
+            for doc_id, frequency in documents.items():
+                if allowed is not None and doc_id not in allowed:
+                    continue
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        return scores
+
+    def to_state(
+            self,
+            prefix: str,
+            arrays: dict[str, np.ndarray]
+    ) -> dict:
+        """
+        Adds the postings to `arrays` under the prefix in CSR layout: the postings of
+        term i are the entries offsets[i]:offsets[i + 1] of the document and frequency arrays.
+        """
+        if self.saved is not None:
+            arrays.update({f"{prefix}_{name}": array for name, array in self.saved.items()})
+            return {"prefix": prefix}
+        if not self.doc_lengths:
+            return {"prefix": prefix}
+
+        positions = {doc_id: position for position, doc_id in enumerate(self.doc_lengths)}
+        offsets = np.zeros(len(self.postings) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(documents) for documents in self.postings.values()])
+        arrays[f"{prefix}_terms"] = _join(list(self.postings))
+        arrays[f"{prefix}_docs"] = _join(list(self.doc_lengths))
+        arrays[f"{prefix}_lengths"] = np.fromiter(self.doc_lengths.values(), dtype=np.int32, count=len(positions))
+        arrays[f"{prefix}_offsets"] = offsets
+        arrays[f"{prefix}_postings"] = np.fromiter(
+            (positions[doc_id] for documents in self.postings.values() for doc_id in documents),
+            dtype=np.int32, count=offsets[-1]
+        )
+        arrays[f"{prefix}_frequencies"] = np.fromiter(
+            (frequency for documents in self.postings.values() for frequency in documents.values()),
+            dtype=np.int32, count=offsets[-1]
+        )
+        return {"prefix": prefix}
+
+    @classmethod
+    def from_state(
+            cls,
+            state: dict,
+            arrays: dict[str, np.ndarray]
+    ) -> "LexicalIndex":
+        """
+        Restores an index saved with to_state. The arrays may be memory-mapped;
+        they are unpacked into postings on the first lexical query or update.
+        """
+        index = cls()
+        names = ("terms", "docs", "lengths", "offsets", "postings", "frequencies")
+        if f"{state['prefix']}_terms" in arrays:
+            index.saved = {name: arrays[f"{state['prefix']}_{name}"] for name in names}
+        return index
+
+    def _unpack(self) -> None:
+        """
+        Builds the postings from the arrays of a restored index.
+        """
+        if self.saved is None:
+            return
+        saved, self.saved = self.saved, None
+
+        doc_ids = _split(saved["docs"])
+        self.doc_lengths = dict(zip(doc_ids, saved["lengths"].tolist()))
+        self.total_length = sum(self.doc_lengths.values())
+        offsets = saved["offsets"].tolist()
+        postings = saved["postings"].tolist()
+        frequencies = saved["frequencies"].tolist()
+        for i, term in enumerate(_split(saved["terms"])):
+            documents = {doc_ids[position]: frequency for position, frequency in zip(
+                postings[offsets[i]:offsets[i + 1]], frequencies[offsets[i]:offsets[i + 1]]
+            )}
+            self.postings[term] = documents
+            for doc_id in documents:
+                self.doc_terms.setdefault(doc_id, []).append(term)
+        logger.debug(f"Unpacked lexical index with {len(self.postings)} terms over {len(doc_ids)} documents")
+
@@ -7,9 +7,11 @@ from ui.printer import printer
 from utils.logger import Logger
 from chatbot.helper import PromptHelper
 from chatbot.history import HistoryManager
+from ollama_client.api_client import OllamaClient
+from ollama_client.connection_pool import close_clients
 from typing import Optional, Any, Callable
 from chatbot.deployer import deploy_chatbot
-from config.settings import Mode, PROCESS_IMAGES
+from config.settings import Mode, PROCESS_IMAGES, WARM_UP, PRELOAD_MODELS
 from utils.command_processor import CommandProcessor
 
 logger = Logger.get_logger()
@@ -32,6 +34,8 @@ class ChatManager:
         self.executor = self.command_processor.executor
 
         self.tasks = []
+        self.last_code_request = ""
+        self.rejected_code_request: str | None = None # Request whose answer the user rejected
         self.task_queue = asyncio.Queue()
         self.worker_running = False
 
@@ -41,15 +45,21 @@ class ChatManager:
         Helper function to initialize ChatMode.
         """
         self.history_manager = HistoryManager(self)
+        self.history_manager.restore_session()
         self.add_to_history = self.history_manager.add_message
         self.add_terminal_output = self.history_manager.add_terminal_output
         self.generate_prompt = self.history_manager.generate_prompt
         self.file_utils.set_index_functions(
             self.history_manager.add_file,
-            self.history_manager.add_folder_structure
+            self.history_manager.add_folder_structure,
+            self.history_manager.sync_folder
         )
 
         self.worker_task = asyncio.create_task(self.task_worker())
+        if len(self.client.endpoints.endpoints) > 1:
+            self.client.endpoints.start()
+        if WARM_UP:
+            self.client.warm_up()
         await self.executor.start_shell()
 
     async def stop(self):
@@ -63,7 +73,21 @@ class ChatManager:
                 logger.info("Worker process is terminated")
             except asyncio.CancelledError:
                 logger.error("Worker task cancelled") 
+        await self.history_manager.analysis.cancel()
+        await self.history_manager.summarizer.cancel()
+        for pool, metrics in OllamaClient.scheduler.metrics().items():
+            logger.info(f"Request slots {pool}: {metrics}")
+        for host, metrics in self.client.endpoints.metrics().items():
+            logger.info(f"Endpoint {host}: {metrics}")
+        logger.info(f"Coalesced {OllamaClient.flights.coalesced} identical requests in flight")
+        for mode, model in OllamaClient.telemetry.models():
+            logger.info(f"Telemetry {mode} ({model}): {OllamaClient.telemetry.summary(mode=mode, model=model)}")
+        await self.client.endpoints.stop()
+        self.history_manager.save_session()
+        self.history_manager.close()
         await self.executor.stop_shell()
+        self.client.close()
+        await close_clients()
 
     async def deploy_task(
             self, 
@@ -73,7 +97,25 @@ class ChatManager:
     )-> str | None:
         """
         Deploys a task based on user input and file content.
+        New input takes precedence over background work: the analysis of the previous
+        exchange is cancelled and file summaries are paused until the task completes.
         """
+        if not hasattr(self, "history_manager"):
+            return await self._deploy_task(user_input, file_name, file_content)
+
+        await self.history_manager.analysis.cancel()
+        await self.history_manager.summarizer.pause()
+        try:
+            return await self._deploy_task(user_input, file_name, file_content)
+        finally:
+            self.history_manager.summarizer.resume()
+
+    async def _deploy_task(
+            self, 
+            user_input: str, 
+            file_name: Optional[str] = None, 
+            file_content: Optional[str] = None,
+    )-> str | None:
         logger.info("Deploy task started.")
         response, action = None, None
         if self.client.mode != Mode.VISION:
@@ -133,6 +175,8 @@ class ChatManager:
         """
         Enqueue a heavy chatbot processing call (e.g. _chat_stream, _fetch_response,
         process_static, _describe_image, etc.) and return its result.
+        Background work (history analysis, summaries) calls the client directly;
+        its requests are ordered behind interactive ones by the request scheduler.
         """
         # Ensure coro_func is an async function
         if not asyncio.iscoroutinefunction(coro_func):
@@ -160,7 +204,7 @@ class ChatManager:
         """
         Processes tasks from the unified queue sequentially.
         Distinguishes heavy processing calls (tuples of 4 elements) and logs execution times
-        and queue sizes.
+        and queue sizes. Each call runs as its own task, so cancelling the caller stops it.
         """
         if self.worker_running:
             logger.info("Task worker already running.")
@@ -176,12 +220,25 @@ class ChatManager:
             # Heavy chatbot processing call: (coro_func, args, kwargs, future)
             if len(task) == 4:
                 coro_func, args, kwargs, future = task
+                if future.done():
+                    # The caller gave up while the call was queued
+                    self.task_queue.task_done()
+                    continue
+                job = asyncio.create_task(coro_func(*args, **kwargs))
+                future.add_done_callback(lambda f, job=job: job.cancel() if f.cancelled() else None)
                 try:
-                    result = await coro_func(*args, **kwargs)
-                    future.set_result(result)
+                    result = await job
+                    if not future.done():
+                        future.set_result(result)
+                except asyncio.CancelledError:
+                    if asyncio.current_task().cancelling():
+                        raise
+                    logger.info("Chatbot task cancelled.")
+                    future.cancel()
                 except Exception as e:
                     logger.error("Chatbot task error: %s", e)
-                    future.set_exception(e)
+                    if not future.done():
+                        future.set_exception(e)
             else:
                 # In case legacy tasks are ever added to this queue.
                 logger.warning("Encountered legacy task in heavy task queue. Skipping.")
@@ -251,23 +308,20 @@ class ChatManager:
     async def _handle_helper_mode(
             self, 
             input:str,
-            strip_json:bool = False
+            strip_json:bool = False,
+            refresh:bool = False
     ) -> str:
         """
-        Function that Handles helper mode
+        Function that Handles helper mode.
+        Calls the helper model directly instead of through the task queue, so it runs
+        next to a stream of another model; the request scheduler limits its concurrency.
+        Callers retrying after an unusable answer pass refresh to bypass the response cache.
         """
-        if self.client.mode != Mode.HELPER:
-            self.client.switch_mode(Mode.HELPER)
-
-        response = await self.deploy_chatbot_method(self.client._fetch_response, input)
+        response = await self.client._fetch_response(input, Mode.HELPER, refresh=refresh)
         if strip_json:
             response = response.strip("`").strip("json")
 
-        filtered_response = await self.deploy_chatbot_method(self.filtering.process_static, response)
-
-        if self.last_mode:
-            self.client.switch_mode(self.last_mode)
-        return filtered_response
+        return self.filtering.filter_text(response)[0]
 
     async def _handle_vision_mode(
             self, 
@@ -313,9 +367,17 @@ class ChatManager:
         logger.info("Shell mode execution started. Bypass: %s", bypass)
         if not bypass:
             code_input = await self._handle_code_mode(PromptHelper.shell_helper(input), shell=True)
+            if PRELOAD_MODELS:
+                # Load the models of the next turn and the history analysis while the command is confirmed
+                self.client.preload(self.last_mode)
+                if self.client.keep_history:
+                    self.client.preload(Mode.HELPER)
             command, output = await self.executor.start(code_input)
             if command:
                 input = command
+            elif output is None:
+                # The generated command was declined, asking the same again must not return it
+                self.rejected_code_request = self.last_code_request
         else:
             self.client.switch_mode(Mode.SHELL)
 
@@ -371,7 +433,16 @@ class ChatManager:
         Heavy processing (fetching response and static processing) is offloaded.
         """
         logger.info("Code mode execution started.")
-        response = await self.deploy_chatbot_method(self.client._fetch_response, input)
+        # Code requests of a topic continue one generate context; shell commands are generated standalone
+        context_key = None
+        if self.client.keep_history and not shell and hasattr(self, "history_manager"):
+            context_key = self.history_manager.current_topic.uid
+        # A request asked again after its answer was rejected is not served from the cache
+        refresh = input == self.rejected_code_request
+        if refresh:
+            self.rejected_code_request = None
+        self.last_code_request = input
+        response = await self.deploy_chatbot_method(self.client._fetch_response, input, None, context_key, refresh)
         if shell:
             command = await self.filtering.extract_shell_command(response)
             logger.info(f"Command {command}")
@@ -0,0 +1,182 @@
+from utils.logger import Logger
+from config.settings import PROMPT_SHARES, CHARS_PER_TOKEN
+
+logger = Logger.get_logger()
+
+
+def estimate_tokens(
+        text: str
+) -> int:
+    """
+    Cheap token estimate based on the average number of characters per token.
+    """
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def truncate_to_tokens(
+        text: str,
+        tokens: int
+) -> str:
+    """
+    Cuts text down to roughly `tokens` tokens on a line boundary.
+    """
+    if estimate_tokens(text) <= tokens:
+        return text
+
+    kept = []
+    used = 0
+    for line in text.splitlines():
+        cost = estimate_tokens(line + "\n")
+        if used + cost > tokens:
+            break
+        kept.append(line)
+        used += cost
+
+    if not kept:
+        # A single overlong line is cut by characters.
+        return text[:tokens * CHARS_PER_TOKEN] + "..."
+    kept.append("...")
+    return "\n".join(kept)
+
+
+class PromptBuilder:
+    """
+    Assembles a prompt within a token budget. The budget is split between the
+    folder structure, retrieved content, file summaries and history; budget a part
+    does not use flows to the next one. Content that does not fit is replaced by
+    its file summary when one is available, otherwise the lowest-scoring content
+    is dropped first.
+    """
+
+    def __init__(
+            self,
+            budget: int,
+            shares: dict = PROMPT_SHARES
+    ) -> None:
+
+        self.budget = budget
+        self.shares = shares
+
+    def build_references(
+            self,
+            query: str,
+            structure: str,
+            items: list[dict],
+            summaries: dict[str, str] | None = None
+    ) -> str:
+        """
+        Builds the user prompt from the query, the folder structure and the retrieved items.
+
+        Args:
+            query (str): The user query.
+            structure (str): The formatted folder structure (may be empty).
+            items (list): Retrieved items with identifier, content, type, lines and score.
+            summaries (dict, optional): File path -> summary of the files of the project.
+
+        Returns:
+            str: The prompt.
+        """
+        summaries = summaries or {}
+        available = max(self.budget - estimate_tokens(query), 0)
+
+        structure_budget = int(available * self.shares["structure"])
+        structure = truncate_to_tokens(structure, structure_budget) if structure else ""
+        structure_tokens = estimate_tokens(structure)
+
+        content_budget = int(available * self.shares["content"]) + structure_budget - structure_tokens
+        references = []
+        summarized = set()
+        used = 0
+        for item in sorted(items, key=lambda x: x["score"], reverse=True):
+            block = self.format_item(item)
+            cost = estimate_tokens(block)
+            if used + cost > content_budget:
+                identifier = item["identifier"]
+                if not references and content_budget - used > 0:
+                    # Always keep the best item, trimmed to the budget.
+                    block = truncate_to_tokens(block, content_budget - used)
+                    references.append(block)
+                    used += estimate_tokens(block)
+                    logger.info(f"Trimmed '{identifier}' to fit the content budget.")
+                elif identifier in summaries and identifier not in summarized:
+                    block = self.format_summary(identifier, summaries[identifier])
+                    summarized.add(identifier)
+                    if used + estimate_tokens(block) <= content_budget:
+                        references.append(block)
+                        used += estimate_tokens(block)
+                        logger.info(f"Replaced '{identifier}' with its summary (over content budget).")
+                    else:
+                        logger.info(f"Dropped '{identifier}' from prompt (over content budget).")
+                else:
+                    logger.info(f"Dropped '{identifier}' from prompt (over content budget).")
+                continue
+            references.append(block)
+            used += cost
+
+        # Summaries of the other files give an overview of the project for a few tokens each.
+        summary_budget = int(available * self.shares.get("summaries", 0)) + content_budget - used
+        referenced = {item["identifier"] for item in items}
+        overview = []
+        for identifier, summary in summaries.items():
+            if identifier in referenced:
+                continue
+            block = self.format_summary(identifier, summary)
+            cost = estimate_tokens(block)
+            if cost > summary_budget:
+                break
+            overview.append(block)
+            summary_budget -= cost
+
+        content_references = ""
+        if references:
+            if structure:
+                content_references += f"Folder structure:\n{structure}\n"
+            content_references += "".join(references)
+            if overview:
+                content_references += "\nOther files:" + "".join(overview)
+
+        prompt = f"{content_references}\nUser query: {query}" if content_references else query
+        logger.info(f"Prompt uses ~{estimate_tokens(prompt)} of {self.budget} tokens before history.")
+        return prompt
+
+    @staticmethod
+    def format_item(
+            item: dict
+    ) -> str:
+        content_type = item["type"]
+        if content_type == "file":
+            label = "Referenced File"
+        elif content_type == "terminal":
+            label = "Referenced Terminal Output"
+        else:
+            label = "Referenced Content"
+        start, end = item["lines"]
+        return f"\n[{label}: {item['identifier']} (lines {start}-{end})]\n{item['content']}\n"
+
+    @staticmethod
+    def format_summary(
+            identifier: str,
+            summary: str
+    ) -> str:
+        return f"\n[File Summary: {identifier}]\n{summary}\n"
+
+    def fit_history(
+            self,
+            messages: list[dict],
+            used_tokens: int
+    ) -> list[dict]:
+        """
+        Keeps the most recent messages that fit into what is left of the budget.
+        """
+        remaining = self.budget - used_tokens
+        kept = []
+        for message in reversed(messages):
+            cost = estimate_tokens(message["content"])
+            if cost > remaining:
+                break
+            kept.append(message)
+            remaining -= cost
+
+        if len(kept) < len(messages):
+            logger.info(f"Trimmed {len(messages) - len(kept)} history messages to fit the token budget.")
+        return list(reversed(kept))
@@ -0,0 +1,169 @@
+import os
+import json
+import uuid
+import shutil
+import sqlite3
+import numpy as np
+from utils.logger import Logger
+from config.settings import SESSION_DIR
+from chatbot.embedding_cache import content_digest
+
+logger = Logger.get_logger()
+
+
+def _alive(
+        pid: int
+) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class SessionStore:
+    """
+    Stores a HistoryManager session on disk: metadata as JSON in SQLite and
+    every array (embedding matrices, lexical postings, chunk tables) as a .npy file.
+    Arrays are memory-mapped (copy-on-write) on restore, so restoring does not read them into RAM.
+
+    Sessions are keyed by the working directory, so instances started in
+    different folders keep separate sessions. Every save writes its arrays to a
+    new generation folder; a generation is only deleted once no session row
+    points to it and no running instance has written or mapped it.
+    """
+
+    def __init__(
+            self,
+            path: str = SESSION_DIR,
+            key: str | None = None
+    ) -> None:
+
+        self.path = path
+        self.db_path = os.path.join(path, "session.db")
+        self.key = key or content_digest(os.path.realpath(os.getcwd()))[:16]
+        self.pid = os.getpid()
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(self.path, exist_ok=True)
+        connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS sessions (key TEXT PRIMARY KEY, generation TEXT NOT NULL, value TEXT NOT NULL)"
+        )
+        # Generations written or mapped by running instances
+        connection.execute(
+            "CREATE TABLE IF NOT EXISTS users (generation TEXT NOT NULL, pid INTEGER NOT NULL, "
+            "PRIMARY KEY (generation, pid))"
+        )
+        return connection
+
+    def _use(
+            self,
+            connection: sqlite3.Connection,
+            generation: str
+    ) -> None:
+        connection.execute("INSERT OR IGNORE INTO users (generation, pid) VALUES (?, ?)", (generation, self.pid))
+
+    def save(
+            self,
+            state: dict,
+            arrays: dict[str, np.ndarray]
+    ) -> None:
+        """
+        Writes the session metadata and arrays. Arrays go to a new generation folder,
+        so arrays mapped from earlier saves (by this or another instance) stay valid.
+
+        Args:
+            state (dict): JSON serializable session metadata.
+            arrays (dict): Array name -> array.
+        """
+        generation = uuid.uuid4().hex
+        folder = os.path.join(self.path, generation)
+        try:
+            connection = self._connect()
+            try:
+                # Claim the generation before writing it, so a concurrent cleanup leaves it alone
+                self._use(connection, generation)
+                os.makedirs(folder, exist_ok=True)
+                for name, array in arrays.items():
+                    np.save(os.path.join(folder, f"{name}.npy"), np.ascontiguousarray(array))
+
+                state = dict(state, arrays=sorted(arrays))
+                connection.execute("BEGIN IMMEDIATE")
+                connection.execute(
+                    "INSERT OR REPLACE INTO sessions (key, generation, value) VALUES (?, ?, ?)",
+                    (self.key, generation, json.dumps(state))
+                )
+                connection.execute("COMMIT")
+                self._cleanup(connection)
+            finally:
+                connection.close()
+
+            logger.info(f"Session saved to {folder} ({len(arrays)} arrays)")
+        except (OSError, sqlite3.Error, TypeError, ValueError) as e:
+            logger.error(f"Failed to save session: {e}")
+
+    def _cleanup(
+            self,
+            connection: sqlite3.Connection
+    ) -> None:
+        """
+        Deletes generation folders no session points to and no other running instance uses.
+        """
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            current = {row[0] for row in connection.execute("SELECT generation FROM sessions")}
+            users: dict[str, set[int]] = {}
+            for generation, pid in connection.execute("SELECT generation, pid FROM users"):
+                users.setdefault(generation, set()).add(pid)
+
+            for generation, pids in users.items():
+                live = {pid for pid in pids if pid == self.pid or _alive(pid)}
+                if generation in current or live - {self.pid}:
+                    # Drop registrations of exited instances only
+                    for pid in pids - live:
+                        connection.execute("DELETE FROM users WHERE generation = ? AND pid = ?", (generation, pid))
+                    continue
+                shutil.rmtree(os.path.join(self.path, generation), ignore_errors=True)
+                connection.execute("DELETE FROM users WHERE generation = ?", (generation,))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+
+    def load(self) -> tuple[dict, dict[str, np.ndarray]] | None:
+        """
+        Returns the session metadata and memory-mapped arrays, or None if no session was saved.
+        """
+        if not os.path.exists(self.db_path):
+            return None
+        try:
+            connection = self._connect()
+            try:
+                connection.execute("BEGIN IMMEDIATE")
+                row = connection.execute(
+                    "SELECT generation, value FROM sessions WHERE key = ?", (self.key,)
+                ).fetchone()
+                if row is not None:
+                    # Registered while locked, so no cleanup can delete the arrays being mapped
+                    self._use(connection, row[0])
+                connection.execute("COMMIT")
+            finally:
+                connection.close()
+            if row is None:
+                return None
+
+            generation, value = row
+            state = json.loads(value)
+            folder = os.path.join(self.path, generation)
+            arrays = {
+                name: np.load(os.path.join(folder, f"{name}.npy"), mmap_mode="c")
+                for name in state.get("arrays", [])
+            }
+            logger.info(f"Session loaded from {folder} ({len(arrays)} arrays)")
+            return state, arrays
+        except (OSError, sqlite3.Error, ValueError) as e:
+            logger.error(f"Failed to load session: {e}")
+            return None
@@ -0,0 +1,108 @@
+import os
+import sqlite3
+from collections import OrderedDict
+from utils.logger import Logger
+from config.settings import Mode, MODE_CONFIGS, SUMMARY_DB, SUMMARY_CACHE_SIZE
+
+logger = Logger.get_logger()
+
+
+class SummaryStore:
+    """
+    Persistent cache of per-file summaries stored in SQLite.
+    Rows are keyed by the digest of the file content and the helper model,
+    so an edited file or another helper model never returns a stale summary.
+    The most recently used summaries are kept in memory, misses are read from SQLite.
+    """
+
+    def __init__(
+            self,
+            path: str = SUMMARY_DB,
+            model: str = MODE_CONFIGS[Mode.HELPER]["model"],
+            max_entries: int = SUMMARY_CACHE_SIZE
+    ) -> None:
+
+        self.path = path
+        self.model = model
+        self.max_entries = max_entries
+        self.summaries: OrderedDict[str, str] = OrderedDict()
+        self.connection: sqlite3.Connection | None = None
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.connection = sqlite3.connect(path)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS summaries ("
+                "digest TEXT NOT NULL, model TEXT NOT NULL, summary TEXT NOT NULL, "
+                "PRIMARY KEY (digest, model))"
+            )
+            self.connection.commit()
+            logger.info(f"Summary store opened at {path}")
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"Failed to open summary store at {path}: {e}")
+            self.connection = None
+
+    def get(
+            self,
+            digest: str
+    ) -> str | None:
+        """
+        Returns the summary of the content with the given digest, or None on a miss.
+        """
+        summary = self.summaries.get(digest)
+        if summary is not None:
+            self.summaries.move_to_end(digest)
+            return summary
+        if not self.connection:
+            return None
+        try:
+            row = self.connection.execute(
+                "SELECT summary FROM summaries WHERE digest = ? AND model = ?",
+                (digest, self.model)
+            ).fetchone()
+        except sqlite3.Error as e:
+            logger.error(f"Summary store lookup failed: {e}")
+            return None
+        if row is None:
+            return None
+        self._remember(digest, row[0])
+        return row[0]
+
+    def put(
+            self,
+            digest: str,
+            summary: str
+    ) -> None:
+        """
+        Stores the summary under the digest.
+        """
+        self._remember(digest, summary)
+        if not self.connection:
+            return
+        try:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO summaries (digest, model, summary) VALUES (?, ?, ?)",
+                (digest, self.model, summary)
+            )
+            self.connection.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Summary store write failed: {e}")
+
+    def _remember(
+            self,
+            digest: str,
+            summary: str
+    ) -> None:
+        """
+        Keeps the summary in memory, evicting the least recently used ones over the limit.
+        """
+        self.summaries[digest] = summary
+        self.summaries.move_to_end(digest)
+        while len(self.summaries) > self.max_entries:
+            self.summaries.popitem(last=False)
+
+    def close(self) -> None:
+        if self.connection:
+            self.connection.close()
+            self.connection = None
@@ -1,3 +1,4 @@
+import os
 from enum import Enum, auto
 from config.system_prompts import *
 
@@ -21,15 +22,32 @@ HELPER_MODEL = "granite3.2:2b"
 VISION_MODEL = "minicpm-v:8b"
 EMBEDDING_MODEL = "nomic-embed-text:latest"
 
-# Mapping Mode to Configuration
+# Mapping Mode to Configuration (budget: token budget of a prompt assembled from history and retrieved content,
+# cache: opt-in reuse of complete responses to identical requests (see RESPONSE_TTL, requests repeated after a declined answer bypass it), keep_alive: how long the server keeps the model loaded)
 MODE_CONFIGS = {
-    Mode.DEFAULT: {"model": DEFAULT_MODEL, "temp": 0.4, "prompt": "", "stream": True},
-    Mode.CODE:    {"model": CODE_MODEL, "temp": 0.5, "prompt": CODE, "stream": True},
-    Mode.SHELL:   {"model": SHELL_MODEL, "temp": 0.4, "prompt": SHELL, "stream": True},
-    Mode.SYSTEM:  {"model": SYSTEM_MODEL, "temp": 0.5, "prompt": SYSTEM, "stream": True},
-    Mode.HELPER:  {"model": HELPER_MODEL, "temp": 0.5, "prompt": "", "stream": False},
-    Mode.VISION:  {"model": VISION_MODEL, "temp": 0.6, "prompt": "", "stream": False},
+    Mode.DEFAULT: {"model": DEFAULT_MODEL, "temp": 0.4, "prompt": "", "stream": True, "budget": 6000, "cache": False, "keep_alive": "30m"},
+    Mode.CODE:    {"model": CODE_MODEL, "temp": 0.5, "prompt": CODE, "stream": True, "budget": 8000, "cache": False, "keep_alive": "10m"},
+    Mode.SHELL:   {"model": SHELL_MODEL, "temp": 0.4, "prompt": SHELL, "stream": True, "budget": 3000, "cache": False, "keep_alive": "15m"},
+    Mode.SYSTEM:  {"model": SYSTEM_MODEL, "temp": 0.5, "prompt": SYSTEM, "stream": True, "budget": 6000, "cache": False, "keep_alive": "15m"},
+    Mode.HELPER:  {"model": HELPER_MODEL, "temp": 0.5, "prompt": "", "stream": False, "budget": 2000, "cache": False, "keep_alive": "30m"},
+    Mode.VISION:  {"model": VISION_MODEL, "temp": 0.6, "prompt": "", "stream": False, "budget": 2000, "cache": False, "keep_alive": "5m"},
 }
+EMBEDDING_KEEP_ALIVE = "30m" # How long the server keeps the embedding model loaded
+WARM_UP = True # Load the models of the active mode and of embeddings at startup
+PRELOAD_MODELS = True # Load the model a flow needs next in the background (e.g. while a shell command is confirmed)
+MAX_CONTEXTS = 8 # Generate contexts kept for continuing code requests (one per topic and model), least recently used are dropped
+
+# Endpoints requests are balanced across, e.g. {"host": "http://gpu1:11434", "models": [EMBEDDING_MODEL], "roles": ["embed"]}
+# ("models" defaults to those the host reports, "roles" to ["generate", "embed"]); empty uses DEFAULT_HOST, --host overrides
+ENDPOINTS = []
+HEALTH_INTERVAL = 30.0 # Seconds between health checks of the endpoints
+HEALTH_TIMEOUT = 5.0 # Seconds a health check waits for an endpoint
+
+# Request scheduling (concurrent requests per model and host, match OLLAMA_NUM_PARALLEL of the server)
+REQUEST_SLOTS = 1 # Default slots of a model
+MODEL_SLOTS = {EMBEDDING_MODEL: 4} # Per-model overrides
+POOL_CONNECTIONS = 10 # Pooled HTTP connections per host, shared by chat, generate and embed
+POOL_KEEPALIVE = 60.0 # Seconds an idle pooled connection is kept open
 
 #Logging
 LOG = True
@@ -43,10 +61,44 @@ RENDER_DELAY = 0.0069 # Delay between rendering lines
 #HistoryManager
 MSG_THR = 0.5 # Simularity threshold for history
 CONT_THR = 0.6 # Simularity threshold for content such as files and terminal output
-NUM_MSG = 5 # Number of messages submitted to the chatbot from history
+NUM_MSG = 5 # Number of recent history messages submitted to the chatbot; the window grows to twice this before moving, so the prompt prefix stays stable
 OFF_THR = 0.7 # Off-topic threshold
 OFF_FREQ = 4 # Off-topic checking frequency (messages)
 SLICE_SIZE = 4 # Last N messages to analyze for off-topic 
+ANALYSIS_DELAY = 2.0 # Seconds without new messages before the history is analyzed in the background
+SUMMARIZE_FILES = False # Summarize indexed files with the helper model in the background, used when the prompt budget is tight
+SUMMARY_TOKENS = 150 # Maximum size of a file summary
+SUMMARY_CACHE_SIZE = 1024 # File summaries kept in memory, others are read from the summary store on use
+LAZY_FILE_CONTENT = True # Keep only chunk offsets of indexed files in memory, chunks are read from disk (mmap) when used
+INDEX_CHUNK_LINES = 60 # Lines per indexed chunk of a file or terminal output
+INDEX_CHUNK_OVERLAP = 10 # Lines shared by neighbouring chunks
+TOP_K_CHUNKS = 4 # Number of chunks retrieved for a prompt
+HYBRID_WEIGHT = 0.3 # Weight of the normalized BM25 score added to the cosine similarity
+PROMPT_SHARES = {"structure": 0.1, "content": 0.6, "summaries": 0.1} # Split of the prompt budget, history gets the rest
+CHARS_PER_TOKEN = 4 # Used to estimate prompt size in tokens
+ANN_THRESHOLD = 20000 # Indexed chunks above which searches use the approximate (IVF) index
+ANN_NPROBE = 8 # IVF lists scanned per search, higher values trade latency for recall
+EMBEDDING_STORAGE = "float32" # "float32", or "float16"/"int8" to search compact vectors in memory and keep full ones on disk
+EMBEDDING_DIMS = 0 # Compact storage only: project vectors down to this many dimensions (0 keeps all)
+RESCORE_FACTOR = 8 # Compact storage only: candidates rescored with the full vectors per requested result
+
+#Embedding cache
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "deepshell")
+PERSIST_EMBEDDINGS = True # Keep embeddings on disk between sessions
+EMBEDDING_DB = os.path.join(CACHE_DIR, "embeddings.db")
+SUMMARY_DB = os.path.join(CACHE_DIR, "summaries.db")
+RESPONSE_DB = os.path.join(CACHE_DIR, "responses.db")
+RESPONSE_TTL = 7 * 24 * 3600 # Seconds a cached response stays valid
+TELEMETRY = True # Record per-call timings (queue wait, time to first token, server-reported load/prefill/decode)
+TELEMETRY_LOG = os.path.join(CACHE_DIR, "telemetry.jsonl")
+TELEMETRY_SIZE = 1000 # Most recent calls kept in memory for queries
+TELEMETRY_BATCH = 32 # Records buffered before they are written to the log (off the event loop)
+TELEMETRY_LOG_SIZE = 10 * 1024 * 1024 # Bytes after which the log is rotated to TELEMETRY_LOG + ".1"
+PERSIST_SESSION = True # Save topics and indexed projects on exit and restore them on startup
+SESSION_DIR = os.path.join(CACHE_DIR, "session")
+EMBEDDING_CACHE_SIZE = 64 * 1024 * 1024 # In-memory embedding cache budget (bytes)
+EMBED_BATCH_SIZE = 32 # Maximum number of texts sent in one embedding request
+EMBED_BATCH_WINDOW = 0.01 # Time to gather concurrent embedding requests into one batch (seconds)
 
 #ShellUtils Config
 SHELL_TYPE = "/bin/bash"
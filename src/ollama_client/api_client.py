@@ -1,15 +1,25 @@
-import ollama
 import asyncio
 import numpy as np
 from utils.logger import Logger
+from contextlib import asynccontextmanager
 from typing import AsyncGenerator, Sequence, cast
-from config.settings import Mode, MODE_CONFIGS, EMBEDDING_MODEL, DEFAULT_HOST
+from ollama_client.connection_pool import get_client
+from ollama_client.endpoint_pool import EndpointPool, GENERATE, EMBED
+from ollama_client.response_cache import ResponseCache
+from ollama_client.telemetry import Telemetry, CallTimer
+from ollama_client.single_flight import SingleFlight, request_key
+from ollama_client.request_scheduler import RequestScheduler
+from config.settings import Mode, MODE_CONFIGS, EMBEDDING_MODEL, EMBEDDING_KEEP_ALIVE, CHARS_PER_TOKEN, MAX_CONTEXTS
 
 logger = Logger.get_logger()
 
 class OllamaClient:
-    # Class-level lock to ensure critical async functions do not run concurrently
-    _global_lock = asyncio.Lock()
+    # Class-level scheduler limiting concurrent requests per model and endpoint
+    scheduler = RequestScheduler()
+    # Class-level store of per-call timings
+    telemetry = Telemetry()
+    # Class-level coalescing of identical requests in flight
+    flights = SingleFlight(scheduler.promote)
 
     def __init__(
             self,
@@ -23,11 +33,14 @@ class OllamaClient:
     ):
 
         logger.info("Initializing OllamaClient")
-        self.client = ollama.AsyncClient(host=host)
+        # Ollama hosts this client's requests are routed across
+        self.endpoints = EndpointPool.from_settings(host)
         self.model = model
         self.config = config
         self.mode = mode
         self.stream = stream
+        self.keep_alive = MODE_CONFIGS[mode]["keep_alive"]
+        self.loading: dict[tuple[str, str], asyncio.Task] = {}
 
         self.pause_stream = False
         self.output_buffer = asyncio.Queue()
@@ -40,9 +53,100 @@ class OllamaClient:
 
         self.keep_history = True
 
+        self._response_cache: ResponseCache | None = None
+        # Context tokens returned by generate, per (conversation key, model), least recently used first
+        self.contexts: dict[tuple[str, str], list[int]] = {}
+
         logger.info(f"Client initialized with model: {model}, mode: {mode}, stream: {stream}")
 
 
+    @property
+    def response_cache(self) -> ResponseCache:
+        """Opened on the first cacheable request."""
+        if self._response_cache is None:
+            self._response_cache = ResponseCache()
+        return self._response_cache
+
+    def close(self) -> None:
+        if self._response_cache:
+            self._response_cache.close()
+            self._response_cache = None
+        OllamaClient.telemetry.close()
+
+    def forget_context(
+            self,
+            context_key: str
+    ) -> None:
+        """Drops the generate contexts stored under the key, e.g. after the topic history was truncated."""
+        for key in [key for key in self.contexts if key[0] == context_key]:
+            del self.contexts[key]
+
+    @asynccontextmanager
+    async def _request(
+            self,
+            model:str,
+            role:str,
+            timer:CallTimer | None = None
+    ):
+        """
+        Routes a request to an endpoint and holds a slot of the model there.
+        Yields the endpoint; its pooled client sends the request.
+        """
+        async with self.endpoints.route(model, role) as endpoint:
+            async with OllamaClient.scheduler.slot(model, endpoint.host):
+                if timer:
+                    timer.acquired(endpoint.host)
+                yield endpoint
+
+    def preload(
+            self,
+            mode:Mode
+    ) -> None:
+        """
+        Loads the model of the mode in the background, so the first request
+        after a switch to it does not wait for the model load.
+        """
+        config = MODE_CONFIGS[mode]
+        model = self.model if mode == self.mode else config["model"]
+        self._schedule_load(model, config["keep_alive"])
+
+    def warm_up(self) -> None:
+        """Loads the model of the active mode and the embedding model in the background."""
+        self._schedule_load(self.model, self.keep_alive)
+        self._schedule_load(EMBEDDING_MODEL, EMBEDDING_KEEP_ALIVE)
+
+    def _schedule_load(
+            self,
+            model:str,
+            keep_alive:str
+    ) -> None:
+        """Loads the model on every endpoint its requests can be routed to."""
+        role = EMBED if model == EMBEDDING_MODEL else GENERATE
+        for endpoint in self.endpoints.candidates(model, role):
+            key = (model, endpoint.host)
+            if key in self.loading:
+                continue
+            task = asyncio.create_task(self._load_model(model, keep_alive, endpoint.host))
+            self.loading[key] = task
+            task.add_done_callback(lambda _, key=key: self.loading.pop(key, None))
+
+    async def _load_model(
+            self,
+            model:str,
+            keep_alive:str,
+            host:str
+    ) -> None:
+        """Sends an empty request, which makes the server load the model without generating."""
+        logger.info(f"Preloading {model} at {host} (keep_alive: {keep_alive})")
+        try:
+            if model == EMBEDDING_MODEL:
+                await get_client(host).embed(model=model, input="", keep_alive=keep_alive)
+            else:
+                await get_client(host).generate(model=model, keep_alive=keep_alive)
+            logger.info(f"{model} loaded at {host}")
+        except Exception as e:
+            logger.warning(f"Failed to preload {model} at {host}: {e}")
+
     def switch_mode(
             self,
             mode:Mode
@@ -58,6 +162,7 @@ class OllamaClient:
             self.model = config["model"]
             self.config = {"temperature": config["temp"], "system": config["prompt"]}
             self.stream = config["stream"]
+            self.keep_alive = config["keep_alive"]
             self.mode = mode
             logger.info(f"Mode switched successfully: {self.mode}")
         except KeyError as e:
@@ -70,8 +175,9 @@ class OllamaClient:
             history=None
     ) -> None:
         """Fetches response from the Ollama API and streams into output buffer."""
-        async with OllamaClient._global_lock:
-            logger.info(f"{self.mode.name} started stream")
+        timer = OllamaClient.telemetry.start("chat", self.mode.name, self.model)
+        async with self._request(self.model, GENERATE, timer) as endpoint:
+            logger.info(f"{self.mode.name} started stream at {endpoint.host}")
 
             if history:
                 input = history
@@ -82,23 +188,33 @@ class OllamaClient:
 
             try:
                 # Force-cast the response to an AsyncGenerator
-                response = cast(AsyncGenerator[dict, None], await self.client.chat(
+                response = cast(AsyncGenerator[dict, None], await get_client(endpoint.host).chat(
                     model=self.model,
                     messages=input,
                     options=self.config,
-                    stream=self.stream
+                    stream=self.stream,
+                    keep_alive=self.keep_alive
                 ))
 
+                final = None
                 async for part in response:
+                    content = part.get('message', {}).get('content', '') 
+                    if content:
+                        timer.token()
+                    if part.get('done'):
+                        # The final part carries the server-side timings
+                        final = part
                     if not self.pause_stream:
-                        content = part.get('message', {}).get('content', '') 
                         await self.output_buffer.put(content)
+                timer.finish(final)
 
                 if not self.pause_stream:
                     await self.output_buffer.put(None)
                     logger.info("Chat stream ended successfully")
 
             except Exception as e:
+                self.endpoints.report(endpoint, e)
+                timer.finish(error=e)
                 logger.error(f"Error during chat stream: {e}")
 
 
@@ -108,47 +224,121 @@ class OllamaClient:
             prompt: str = "Describe"
     )-> str | None:
         """Describes an image using the vision model."""
-        async with OllamaClient._global_lock:
+        # Checked before a slot is taken, so every timed call is one sent to the model
+        if not image:
+            logger.warning("No image provided")
+            return "No image provided"
+
+        if self.mode != Mode.VISION:
+            return None
+
+        timer = OllamaClient.telemetry.start("image", self.mode.name, self.model)
+        async with self._request(self.model, GENERATE, timer) as endpoint:
             logger.info(f"{self.mode.name} describing image")
-            
-            if not image:
-                logger.warning("No image provided")
-                return "No image provided"
-
-            if self.mode == Mode.VISION: 
-                try:
-                    response = await self.client.generate(model=self.model, prompt=prompt, images = [image])
-                    logger.debug(f"Image description response: {response}")
-                    message_data = response.response
-
-                    if message_data:
-                        return message_data
-                    else:
-                        logger.warning("No message found in response")
-                        return "No message in response"
-
-                except Exception as e:
-                    logger.error(f"Error while describing image: {e}")
-                    return "Error processing image"
+
+            try:
+                response = await get_client(endpoint.host).generate(model=self.model, prompt=prompt, images = [image], keep_alive=self.keep_alive)
+                timer.finish(response)
+                logger.debug(f"Image description response: {response}")
+                message_data = response.response
+
+                if message_data:
+                    return message_data
+                else:
+                    logger.warning("No message found in response")
+                    return "No message in response"
+
+            except Exception as e:
+                self.endpoints.report(endpoint, e)
+                timer.finish(error=e)
+                logger.error(f"Error while describing image: {e}")
+                return "Error processing image"
 
     async def _fetch_response(
             self, 
-            input:str
+            input:str,
+            mode:Mode | None = None,
+            context_key:str | None = None,
+            refresh:bool = False
     ) -> str:
-        """Fetches a complete response from the model."""
-        async with OllamaClient._global_lock:
-            logger.info(f"{self.mode.name} is fetching response")
+        """
+        Fetches a complete response from the model.
+        When a mode is given its model is used without switching the client,
+        so helper calls can run while the current mode keeps streaming.
+        With a context key (e.g. the topic id) the context returned by the previous
+        call with that key is passed back, so the server only prefills the new prompt.
+        A context that would take the prompt over the token budget of the mode is dropped
+        and the conversation starts a new one.
+        Identical requests in flight at the same time share one upstream call.
+        With refresh the cached response and the context are not used and the cached
+        response is replaced by a new one, e.g. when the caller rejected or could not
+        parse the previous answer.
+        """
+        mode = mode or self.mode
+        if mode == self.mode:
+            model, options, keep_alive = self.model, self.config, self.keep_alive
+        else:
+            config = MODE_CONFIGS[mode]
+            model, options = config["model"], {"temperature": config["temp"], "system": config["prompt"]}
+            keep_alive = config["keep_alive"]
+
+        context = self.contexts.get((context_key, model)) if context_key and not refresh else None
+        budget = MODE_CONFIGS.get(mode, {}).get("budget", 0)
+        if context and len(context) + len(input) // CHARS_PER_TOKEN > budget:
+            logger.info(f"Context of {len(context)} tokens exceeds the {mode.name} budget, starting a new one")
+            del self.contexts[(context_key, model)]
+            context = None
+
+        key = None
+        # A prompt continuing a conversation is not cached, its answer depends on the context
+        if MODE_CONFIGS.get(mode, {}).get("cache") and not context:
+            key = ResponseCache.key(model, options, input)
+            cached = None if refresh else self.response_cache.get(key)
+            if cached is not None:
+                logger.info(f"{mode.name} response served from cache")
+                return cached
+
+        flight = request_key("generate", model, options, input, context_key, context)
+        return await OllamaClient.flights.do(
+            flight,
+            lambda: self._generate(input, mode, model, keep_alive, context, context_key, key)
+        )
+
+    async def _generate(
+            self,
+            input:str,
+            mode:Mode,
+            model:str,
+            keep_alive:str,
+            context:list[int] | None,
+            context_key:str | None,
+            key:str | None
+    ) -> str:
+        """Sends one generate request for _fetch_response and stores its context and cache entry."""
+        timer = OllamaClient.telemetry.start("generate", mode.name, model)
+        async with self._request(model, GENERATE, timer) as endpoint:
+            logger.info(f"{mode.name} is fetching response")
 
             try:
-                response = await self.client.generate(model=self.model, prompt=input)
+                response = await get_client(endpoint.host).generate(model=model, prompt=input, context=context, keep_alive=keep_alive)
+                timer.finish(response)
+                if context_key and response.context:
+                    self.contexts.pop((context_key, model), None)
+                    self.contexts[(context_key, model)] = list(response.context)
+                    while len(self.contexts) > MAX_CONTEXTS:
+                        del self.contexts[next(iter(self.contexts))]
                 logger.info("Response received successfully")
                 message_data = response.response
                 if not message_data:
                     logger.warning("No message found in response")
                     return "No message in response"
 
+                if key:
+                    self.response_cache.put(key, message_data)
                 return message_data 
             except Exception as e:
+                self.endpoints.report(endpoint, e)
+                timer.finish(error=e)
                 logger.error(f"Error fetching response: {e}")
                 return "Error fetching response"
 
@@ -159,13 +349,30 @@ class OllamaClient:
             functions: list  = []
     )-> Sequence | None:
         """Fetches a complete response from the model."""
-        async with OllamaClient._global_lock:
-            logger.info(f"{self.mode.name} is fetching response")
+        flight = request_key("tools", self.model, input, functions)
+        return await OllamaClient.flights.do(
+            flight,
+            lambda: self._chat_tools(input, functions, self.mode, self.model, self.keep_alive)
+        )
+
+    async def _chat_tools(
+            self,
+            input:str,
+            functions:list,
+            mode:Mode,
+            model:str,
+            keep_alive:str
+    ) -> Sequence | None:
+        """Sends one tool-calling chat request for _call_function."""
+        timer = OllamaClient.telemetry.start("tools", mode.name, model)
+        async with self._request(model, GENERATE, timer) as endpoint:
+            logger.info(f"{mode.name} is fetching response")
             logger.info(functions)
 
             try:
                 message = {'role': 'user', 'content': input}
-                response = await self.client.chat(model=self.model, messages=[message],tools = functions)
+                response = await get_client(endpoint.host).chat(model=model, messages=[message],tools = functions, keep_alive=keep_alive)
+                timer.finish(response)
                 logger.info(f"Full response: {response}")
                 if response.message.tool_calls:
                     return response.message.tool_calls
@@ -175,28 +382,55 @@ class OllamaClient:
                     return None
                 
             except Exception as e:
+                self.endpoints.report(endpoint, e)
+                timer.finish(error=e)
                 logger.error(f"Error fetching response: {e}")
                 return "Error fetching response"
 
 
-    @staticmethod
     async def fetch_embedding(
+            self,
             text: str
     )-> np.ndarray | None:
         """
-        Asynchronously fetches and caches an embedding for the given text while ensuring 
-        that no other locked operation (such as streaming) runs concurrently.
+        Asynchronously fetches an embedding for the given text.
         """
-        async with OllamaClient._global_lock:
-            client = ollama.Client(host=DEFAULT_HOST)
+        embeddings = await self.fetch_embeddings([text])
+        if embeddings:
+            return embeddings[0]
+        return
+
+    async def fetch_embeddings(
+            self,
+            texts: list[str]
+    )-> list | None:
+        """
+        Fetches embeddings for a list of texts in a single /api/embed request.
+        Holds a slot of the embedding model only, so it does not wait for a running stream,
+        and is routed separately from generation to the endpoints serving embeddings.
+        Identical batches requested concurrently share one request.
+        """
+        if not texts:
+            return []
+
+        return await OllamaClient.flights.do(request_key("embed", EMBEDDING_MODEL, texts), lambda: self._embed(texts))
+
+    async def _embed(
+            self,
+            texts: list[str]
+    )-> list | None:
+        """Sends one /api/embed request for fetch_embeddings."""
+        timer = OllamaClient.telemetry.start("embed", "EMBEDDING", EMBEDDING_MODEL)
+        async with self._request(EMBEDDING_MODEL, EMBED, timer) as endpoint:
             try:
-                logger.info("Fetching embedding")
-                # Offload blocking work to a thread if needed
-                response = await asyncio.to_thread(client.embeddings, model=EMBEDDING_MODEL, prompt=text)
-                embedding = response['embedding']
-                logger.debug(f"Extracted {len(embedding)} embeddings")
-                return embedding
+                logger.info(f"Fetching embeddings for {len(texts)} texts at {endpoint.host}")
+                response = await get_client(endpoint.host).embed(model=EMBEDDING_MODEL, input=texts, keep_alive=EMBEDDING_KEEP_ALIVE)
+                timer.finish(response)
+                embeddings = response['embeddings']
+                logger.debug(f"Extracted {len(embeddings)} embeddings")
+                return embeddings
             except Exception as e:
-                logger.error(f"Error fetching embedding for text: {text}. Error: {str(e)}")
+                self.endpoints.report(endpoint, e)
+                timer.finish(error=e)
+                logger.error(f"Error fetching embeddings for {len(texts)} texts. Error: {str(e)}")
                 return
-
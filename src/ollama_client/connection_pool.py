@@ -0,0 +1,47 @@
+import httpx
+import ollama
+from utils.logger import Logger
+from config.settings import POOL_CONNECTIONS, POOL_KEEPALIVE
+
+logger = Logger.get_logger()
+
+# One async client per Ollama host, sending through an HTTP transport (connection pool) owned here
+_clients: dict[str, ollama.AsyncClient] = {}
+_transports: dict[str, httpx.AsyncHTTPTransport] = {}
+
+
+def get_client(
+        host: str
+) -> ollama.AsyncClient:
+    """
+    Returns the shared async client of the host, creating it on first use.
+    Chat, generate and embed requests to the same host reuse its kept-alive connections.
+    """
+    client = _clients.get(host)
+    if client is None:
+        transport = httpx.AsyncHTTPTransport(
+            limits=httpx.Limits(
+                max_connections=POOL_CONNECTIONS,
+                max_keepalive_connections=POOL_CONNECTIONS,
+                keepalive_expiry=POOL_KEEPALIVE
+            )
+        )
+        client = ollama.AsyncClient(host=host, transport=transport)
+        _clients[host] = client
+        _transports[host] = transport
+        logger.info(f"Opened connection pool for {host}")
+    return client
+
+
+async def close_clients() -> None:
+    """
+    Closes the connections of every pooled client.
+    """
+    for host, transport in list(_transports.items()):
+        try:
+            await transport.aclose()
+            logger.info(f"Closed connection pool for {host}")
+        except Exception as e:
+            logger.error(f"Failed to close connection pool for {host}: {e}")
+    _clients.clear()
+    _transports.clear()
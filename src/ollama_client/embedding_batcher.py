@@ -0,0 +1,87 @@
+import asyncio
+import contextvars
+from utils.logger import Logger
+from typing import Any, Awaitable, Callable
+from config.settings import EMBED_BATCH_SIZE, EMBED_BATCH_WINDOW
+
+logger = Logger.get_logger()
+
+class EmbeddingBatcher:
+    """
+    Gathers concurrent embedding requests that arrive within a short window
+    and sends them upstream as a single batch. Identical texts in the same
+    window share one slot of the batch.
+    """
+
+    def __init__(
+            self,
+            fetch_batch: Callable[[list[str]], Awaitable[Any]],
+            window: float = EMBED_BATCH_WINDOW,
+            max_batch: int = EMBED_BATCH_SIZE
+    ) -> None:
+
+        self.fetch_batch = fetch_batch
+        self.window = window
+        self.max_batch = max_batch
+        self.pending: dict[str, list[asyncio.Future]] = {}
+        self.flush_task: asyncio.Task | None = None
+        # Batches being sent; referenced until done so they are not garbage collected
+        self.sending: set[asyncio.Task] = set()
+
+    async def embed(
+            self,
+            text: str
+    ) -> Any:
+        """
+        Queues the text for the next batch and waits for its embedding.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self.pending.setdefault(text, []).append(future)
+
+        if len(self.pending) >= self.max_batch:
+            self._flush()
+        elif self.flush_task is None:
+            self.flush_task = asyncio.create_task(self._flush_later())
+
+        return await future
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.window)
+        self.flush_task = None
+        self._flush()
+
+    def _flush(self) -> None:
+        """
+        Detaches the pending batch and sends it upstream.
+        """
+        if self.flush_task is not None and self.flush_task is not asyncio.current_task():
+            self.flush_task.cancel()
+        self.flush_task = None
+
+        batch, self.pending = self.pending, {}
+        if batch:
+            # Send from a fresh context, so a batch started by background work
+            # is not queued or preempted as background work itself.
+            task = asyncio.create_task(self._send(batch), context=contextvars.Context())
+            self.sending.add(task)
+            task.add_done_callback(self.sending.discard)
+
+    async def _send(
+            self,
+            batch: dict[str, list[asyncio.Future]]
+    ) -> None:
+        texts = list(batch)
+        logger.debug(f"Sending embedding batch of {len(texts)} texts")
+        try:
+            embeddings = await self.fetch_batch(texts)
+        except Exception as e:
+            logger.error(f"Embedding batch failed: {e}")
+            embeddings = None
+
+        if not embeddings or len(embeddings) != len(texts):
+            embeddings = [None] * len(texts)
+
+        for text, embedding in zip(texts, embeddings):
+            for future in batch[text]:
+                if not future.done():
+                    future.set_result(embedding)
@@ -0,0 +1,176 @@
+import httpx
+import asyncio
+from utils.logger import Logger
+from contextlib import asynccontextmanager
+from ollama_client.connection_pool import get_client
+from config.settings import ENDPOINTS, DEFAULT_HOST, HEALTH_INTERVAL, HEALTH_TIMEOUT
+
+logger = Logger.get_logger()
+
+# Request roles an endpoint can serve
+GENERATE = "generate"
+EMBED = "embed"
+
+
+class Endpoint:
+    """
+    One Ollama host with the models and request roles it serves.
+    Without a configured model list, the models reported by its health check are used.
+    """
+
+    def __init__(
+            self,
+            host: str,
+            models: list[str] | None = None,
+            roles: list[str] | None = None
+    ) -> None:
+
+        self.host = host
+        self.models = set(models) if models else None
+        self.roles = set(roles) if roles else {GENERATE, EMBED}
+        self.available: set[str] | None = None
+        self.healthy = True
+        self.outstanding = 0
+        self.requests = 0
+        self.failures = 0
+
+    def serves(
+            self,
+            model: str,
+            role: str
+    ) -> bool:
+        if role not in self.roles:
+            return False
+        models = self.models if self.models is not None else self.available
+        return models is None or model in models
+
+    def metrics(self) -> dict:
+        return {
+            "healthy": self.healthy,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "failures": self.failures,
+        }
+
+
+class EndpointPool:
+    """
+    Routes requests across several Ollama hosts. A request goes to the healthy
+    endpoint serving its model and role with the fewest outstanding requests
+    (queued or running); endpoints found unreachable are skipped until a
+    periodic health check sees them again.
+    """
+
+    def __init__(
+            self,
+            endpoints: list[Endpoint]
+    ) -> None:
+
+        self.endpoints = endpoints
+        self.health_task: asyncio.Task | None = None
+
+    @classmethod
+    def from_settings(
+            cls,
+            host: str = DEFAULT_HOST
+    ) -> "EndpointPool":
+        """
+        Builds the pool from ENDPOINTS; a host other than DEFAULT_HOST (--host) replaces them.
+        """
+        if ENDPOINTS and host == DEFAULT_HOST:
+            return cls([
+                Endpoint(config["host"], config.get("models"), config.get("roles"))
+                for config in ENDPOINTS
+            ])
+        return cls([Endpoint(host)])
+
+    def candidates(
+            self,
+            model: str,
+            role: str
+    ) -> list[Endpoint]:
+        """
+        Returns the endpoints serving the model and role, healthy ones only when there are any.
+        """
+        serving = [endpoint for endpoint in self.endpoints if endpoint.serves(model, role)]
+        healthy = [endpoint for endpoint in serving if endpoint.healthy]
+        return healthy or serving or self.endpoints[:1]
+
+    def select(
+            self,
+            model: str,
+            role: str
+    ) -> Endpoint:
+        return min(self.candidates(model, role), key=lambda endpoint: (endpoint.outstanding, endpoint.requests))
+
+    @asynccontextmanager
+    async def route(
+            self,
+            model: str,
+            role: str
+    ):
+        """
+        Picks an endpoint for the request and counts it as outstanding there until the block exits.
+        """
+        endpoint = self.select(model, role)
+        endpoint.outstanding += 1
+        endpoint.requests += 1
+        try:
+            yield endpoint
+        finally:
+            endpoint.outstanding -= 1
+
+    def report(
+            self,
+            endpoint: Endpoint,
+            error: Exception
+    ) -> None:
+        """
+        Marks the endpoint unhealthy when a request failed to reach it: ollama raises
+        ConnectionError for plain requests, streamed ones raise the httpx transport error
+        (e.g. ConnectError, TimeoutException).
+        """
+        endpoint.failures += 1
+        if isinstance(error, (ConnectionError, httpx.TransportError)) and len(self.endpoints) > 1:
+            endpoint.healthy = False
+            logger.warning(f"Endpoint {endpoint.host} is unreachable, routing around it")
+
+    async def check(
+            self,
+            endpoint: Endpoint
+    ) -> bool:
+        """
+        Lists the models of the endpoint; an answer marks it healthy and updates its available models.
+        """
+        try:
+            response = await asyncio.wait_for(get_client(endpoint.host).list(), HEALTH_TIMEOUT)
+            endpoint.available = {model["model"] for model in response["models"]}
+            if not endpoint.healthy:
+                logger.info(f"Endpoint {endpoint.host} is reachable again")
+            endpoint.healthy = True
+        except Exception as e:
+            if endpoint.healthy:
+                logger.warning(f"Health check of {endpoint.host} failed: {e}")
+            endpoint.healthy = False
+        return endpoint.healthy
+
+    def start(self) -> None:
+        """
+        Starts the periodic health checks.
+        """
+        if self.health_task is None or self.health_task.done():
+            self.health_task = asyncio.create_task(self._health_loop())
+
+    async def stop(self) -> None:
+        task, self.health_task = self.health_task, None
+        if task and not task.done():
+            task.cancel()
+            await asyncio.wait([task])
+
+    async def _health_loop(self) -> None:
+        while True:
+            await asyncio.gather(*(self.check(endpoint) for endpoint in self.endpoints))
+            await asyncio.sleep(HEALTH_INTERVAL)
+
+    def metrics(self) -> dict[str, dict]:
+        return {endpoint.host: endpoint.metrics() for endpoint in self.endpoints}
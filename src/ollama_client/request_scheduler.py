@@ -0,0 +1,167 @@
+import heapq
+import asyncio
+import itertools
+import contextvars
+from utils.logger import Logger
+from contextlib import asynccontextmanager
+from config.settings import REQUEST_SLOTS, MODEL_SLOTS
+
+logger = Logger.get_logger()
+
+# True inside background work (history analysis, summaries); its requests wait behind interactive ones
+background = contextvars.ContextVar("background", default=False)
+
+INTERACTIVE = 0
+BACKGROUND = 1
+
+
+class SlotPool:
+    """
+    A fixed number of concurrency slots for one model on one endpoint.
+    Waiters are served by priority, then in arrival order; a released slot
+    is handed directly to the next waiter.
+    """
+
+    def __init__(
+            self,
+            slots: int
+    ) -> None:
+
+        self.slots = max(slots, 1)
+        self.active = 0
+        self.waiters: list[tuple[int, int, asyncio.Future, asyncio.Task | None]] = []
+        self.counter = itertools.count()
+
+        self.requests = 0
+        self.max_waiting = 0
+        self.wait_time = 0.0
+        self.max_wait = 0.0
+
+    @property
+    def waiting(self) -> int:
+        return sum(1 for _, _, future, _ in self.waiters if not future.done())
+
+    async def acquire(
+            self,
+            priority: int = INTERACTIVE
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+
+        if self.active < self.slots and not self.waiting:
+            self.active += 1
+        else:
+            future = loop.create_future()
+            heapq.heappush(self.waiters, (priority, next(self.counter), future, asyncio.current_task()))
+            self.max_waiting = max(self.max_waiting, self.waiting)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    # The slot was handed over just before the cancellation
+                    self.release()
+                raise
+
+        waited = loop.time() - start
+        self.requests += 1
+        self.wait_time += waited
+        self.max_wait = max(self.max_wait, waited)
+
+    def release(self) -> None:
+        while self.waiters:
+            _, _, future, _ = heapq.heappop(self.waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def promote(
+            self,
+            task: asyncio.Task
+    ) -> None:
+        """
+        Moves the waits of the task to interactive priority, keeping their place in arrival order.
+        """
+        promoted = [
+            (INTERACTIVE, count, future, waiter) if waiter is task else (priority, count, future, waiter)
+            for priority, count, future, waiter in self.waiters
+        ]
+        if promoted != self.waiters:
+            self.waiters = promoted
+            heapq.heapify(self.waiters)
+
+    def metrics(self) -> dict:
+        return {
+            "slots": self.slots,
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "requests": self.requests,
+            "avg_wait": self.wait_time / self.requests if self.requests else 0.0,
+            "max_wait": self.max_wait,
+        }
+
+
+class RequestScheduler:
+    """
+    Limits concurrent requests per (model, endpoint) pair, so requests to
+    different models (e.g. embeddings and a chat stream) run side by side
+    while each model gets at most as many requests as the server runs in parallel.
+    """
+
+    def __init__(
+            self,
+            default_slots: int = REQUEST_SLOTS,
+            slots: dict[str, int] = MODEL_SLOTS
+    ) -> None:
+
+        self.default_slots = default_slots
+        self.slots = slots
+        self.pools: dict[tuple[str, str], SlotPool] = {}
+
+    def _pool(
+            self,
+            model: str,
+            endpoint: str
+    ) -> SlotPool:
+        pool = self.pools.get((model, endpoint))
+        if pool is None:
+            pool = SlotPool(self.slots.get(model, self.default_slots))
+            self.pools[(model, endpoint)] = pool
+        return pool
+
+    @asynccontextmanager
+    async def slot(
+            self,
+            model: str,
+            endpoint: str
+    ):
+        """
+        Holds one slot of the model on the endpoint for the duration of the block.
+        Requests made from background work wait behind interactive ones.
+        """
+        pool = self._pool(model, endpoint)
+        if pool.active >= pool.slots:
+            logger.debug(f"Waiting for a slot of {model} at {endpoint} ({pool.waiting} queued)")
+        await pool.acquire(BACKGROUND if background.get() else INTERACTIVE)
+        try:
+            yield
+        finally:
+            pool.release()
+
+    def promote(
+            self,
+            task: asyncio.Task
+    ) -> None:
+        """
+        Serves a background task waiting for a slot at interactive priority,
+        e.g. when an interactive request joined its call.
+        """
+        for pool in self.pools.values():
+            pool.promote(task)
+
+    def metrics(self) -> dict[str, dict]:
+        """
+        Returns the slot and queue-depth counters of every (model, endpoint) pair.
+        """
+        return {f"{model}@{endpoint}": pool.metrics() for (model, endpoint), pool in self.pools.items()}
@@ -0,0 +1,108 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+from utils.logger import Logger
+from config.settings import RESPONSE_DB, RESPONSE_TTL
+
+logger = Logger.get_logger()
+
+
+class ResponseCache:
+    """
+    Persistent cache of complete (non-streamed) model responses stored in SQLite.
+    Entries are keyed by a hash of the model, options, system prompt and prompt,
+    and expire `ttl` seconds after they were stored.
+    """
+
+    def __init__(
+            self,
+            path: str = RESPONSE_DB,
+            ttl: float = RESPONSE_TTL
+    ) -> None:
+
+        self.path = path
+        self.ttl = ttl
+        self.responses: dict[str, tuple[float, str]] = {}
+        self.connection: sqlite3.Connection | None = None
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.connection = sqlite3.connect(path)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, created REAL NOT NULL, response TEXT NOT NULL)"
+            )
+            self.connection.execute("DELETE FROM responses WHERE created < ?", (time.time() - ttl,))
+            self.connection.commit()
+            logger.info(f"Response cache opened at {path}")
+        except (sqlite3.Error, OSError) as e:
+            logger.error(f"Failed to open response cache at {path}: {e}")
+            self.connection = None
+
+    @staticmethod
+    def key(
+            model: str,
+            options: dict,
+            prompt: str
+    ) -> str:
+        """
+        Returns the cache key of a request; the system prompt is part of the options.
+        """
+        payload = json.dumps([model, options, prompt], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(
+            self,
+            key: str
+    ) -> str | None:
+        """
+        Returns the cached response, or None on a miss or an expired entry.
+        """
+        entry = self.responses.get(key)
+        if entry is None and self.connection:
+            try:
+                row = self.connection.execute(
+                    "SELECT created, response FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+            except sqlite3.Error as e:
+                logger.error(f"Response cache lookup failed: {e}")
+                return None
+            if row is not None:
+                entry = (row[0], row[1])
+                self.responses[key] = entry
+
+        if entry is None:
+            return None
+        if time.time() - entry[0] > self.ttl:
+            self.responses.pop(key, None)
+            return None
+        return entry[1]
+
+    def put(
+            self,
+            key: str,
+            response: str
+    ) -> None:
+        """
+        Stores the response under the key.
+        """
+        created = time.time()
+        self.responses[key] = (created, response)
+        if not self.connection:
+            return
+        try:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, created, response) VALUES (?, ?, ?)",
+                (key, created, response)
+            )
+            self.connection.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Response cache write failed: {e}")
+
+    def close(self) -> None:
+        if self.connection:
+            self.connection.close()
+            self.connection = None
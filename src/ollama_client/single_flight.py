@@ -0,0 +1,88 @@
+import json
+import asyncio
+import hashlib
+import contextvars
+from utils.logger import Logger
+from typing import Any, Awaitable, Callable
+from ollama_client.request_scheduler import background
+
+logger = Logger.get_logger()
+
+
+def request_key(
+        *parts: Any
+) -> str:
+    """
+    Returns a hash identifying a request by its parts (kind, model, options, payload).
+    """
+    payload = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent calls: the first caller starts the call and
+    callers arriving while it is in flight await the same result. The call only
+    stops when every caller waiting for it has been cancelled.
+
+    The call runs in its own context rather than a copy of the first caller's: it runs
+    as background work only while every caller is background work, and an interactive
+    caller joining it promotes it (through `promote`, e.g. RequestScheduler.promote).
+    """
+
+    def __init__(
+            self,
+            promote: Callable[[asyncio.Task], None] | None = None
+    ) -> None:
+
+        self.calls: dict[str, asyncio.Task] = {}
+        self.contexts: dict[str, contextvars.Context] = {}
+        self.waiters: dict[str, int] = {}
+        self.coalesced = 0
+        self.promote = promote
+
+    async def do(
+            self,
+            key: str,
+            call: Callable[[], Awaitable[Any]]
+    ) -> Any:
+        task = self.calls.get(key)
+        if task is None:
+            context = contextvars.Context()
+            context.run(background.set, background.get())
+            task = asyncio.create_task(call(), context=context)
+            self.calls[key] = task
+            self.contexts[key] = context
+            self.waiters[key] = 0
+            task.add_done_callback(lambda _: self._forget(key, task))
+        else:
+            self.coalesced += 1
+            logger.info(f"Joined an identical request in flight ({self.waiters[key]} waiting)")
+            context = self.contexts[key]
+            if not background.get() and context.get(background):
+                # The call is suspended here, so its context can be updated
+                context.run(background.set, False)
+                if self.promote:
+                    self.promote(task)
+
+        self.waiters[key] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done() and self.waiters.get(key) == 1:
+                # The last caller gave up, nobody needs the result
+                task.cancel()
+            raise
+        finally:
+            if key in self.waiters and self.calls.get(key) is task:
+                self.waiters[key] -= 1
+
+    def _forget(
+            self,
+            key: str,
+            task: asyncio.Task
+    ) -> None:
+        if self.calls.get(key) is task:
+            del self.calls[key]
+            del self.contexts[key]
+            del self.waiters[key]
@@ -0,0 +1,224 @@
+import os
+import json
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from utils.logger import Logger
+from config.settings import TELEMETRY, TELEMETRY_LOG, TELEMETRY_SIZE, TELEMETRY_BATCH, TELEMETRY_LOG_SIZE
+
+logger = Logger.get_logger()
+
+# Server-reported fields of a final response, durations in nanoseconds
+SERVER_FIELDS = ("load_duration", "prompt_eval_count", "prompt_eval_duration", "eval_count", "eval_duration", "total_duration")
+
+
+class CallTimer:
+    """
+    Measures one model call on the client side: queue wait for a request slot,
+    time to first token and the gaps between streamed tokens.
+    """
+
+    def __init__(
+            self,
+            telemetry: "Telemetry",
+            kind: str,
+            mode: str,
+            model: str
+    ) -> None:
+
+        self.telemetry = telemetry
+        self.record = {"time": time.time(), "kind": kind, "mode": mode, "model": model, "host": None}
+        self.start = time.perf_counter()
+        self.sent = self.start
+        self.first_token: float | None = None
+        self.last_token: float | None = None
+        self.gaps = 0
+        self.gap_total = 0.0
+        self.gap_max = 0.0
+
+    def acquired(
+            self,
+            host: str
+    ) -> None:
+        """
+        Marks the moment the request got its endpoint slot and is sent.
+        """
+        self.record["host"] = host
+        self.sent = time.perf_counter()
+
+    def token(self) -> None:
+        """
+        Marks the arrival of a streamed token.
+        """
+        now = time.perf_counter()
+        if self.first_token is None:
+            self.first_token = now
+        else:
+            gap = now - self.last_token
+            self.gaps += 1
+            self.gap_total += gap
+            self.gap_max = max(self.gap_max, gap)
+        self.last_token = now
+
+    def finish(
+            self,
+            response=None,
+            error: Exception | None = None
+    ) -> dict:
+        """
+        Completes the record with the server-reported timings of the final response and stores it.
+        """
+        end = time.perf_counter()
+        record = self.record
+        record["queue_wait"] = self.sent - self.start
+        record["latency"] = end - self.sent
+        record["ttft"] = self.first_token - self.sent if self.first_token is not None else None
+        record["gap_avg"] = self.gap_total / self.gaps if self.gaps else None
+        record["gap_max"] = self.gap_max if self.gaps else None
+
+        for field in SERVER_FIELDS:
+            value = response.get(field) if response is not None else None
+            if value is not None and field.endswith("duration"):
+                value /= 1e9
+            record[field] = value
+
+        record["prefill_rate"] = _rate(record["prompt_eval_count"], record["prompt_eval_duration"])
+        record["decode_rate"] = _rate(record["eval_count"], record["eval_duration"])
+        record["error"] = str(error) if error else None
+
+        self.telemetry.add(record)
+        return record
+
+
+def _rate(
+        count: int | None,
+        duration: float | None
+) -> float | None:
+    return count / duration if count and duration else None
+
+
+class Telemetry:
+    """
+    In-process store of per-call metrics, tagged by mode and model.
+    The most recent records are kept in memory for queries and every record
+    is appended to a JSONL log. Records are written in batches by a worker thread,
+    and the log is rotated once it grows past `max_bytes` (one previous log is kept).
+    """
+
+    def __init__(
+            self,
+            path: str = TELEMETRY_LOG,
+            size: int = TELEMETRY_SIZE,
+            enabled: bool = TELEMETRY,
+            batch: int = TELEMETRY_BATCH,
+            max_bytes: int = TELEMETRY_LOG_SIZE
+    ) -> None:
+
+        self.path = path
+        self.enabled = enabled
+        self.batch = batch
+        self.max_bytes = max_bytes
+        self.records: deque[dict] = deque(maxlen=size)
+        self.pending: list[dict] = []
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="telemetry")
+        self.file = None
+
+    def start(
+            self,
+            kind: str,
+            mode: str,
+            model: str
+    ) -> CallTimer:
+        return CallTimer(self, kind, mode, model)
+
+    def add(
+            self,
+            record: dict
+    ) -> None:
+        if not self.enabled:
+            return
+        self.records.append(record)
+        self.pending.append(record)
+        if len(self.pending) >= self.batch:
+            self.flush()
+
+    def flush(self) -> Future | None:
+        """
+        Hands the buffered records to the writer thread.
+        """
+        if not self.pending:
+            return None
+        records, self.pending = self.pending, []
+        return self.writer.submit(self._write, records)
+
+    def _write(
+            self,
+            records: list[dict]
+    ) -> None:
+        """
+        Appends the records to the log, rotating it first when it is full. Runs on the writer thread.
+        """
+        try:
+            if self.file is None:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                self.file = open(self.path, "a", encoding="utf-8")
+            if self.max_bytes and os.fstat(self.file.fileno()).st_size >= self.max_bytes:
+                self.file.close()
+                self.file = None
+                os.replace(self.path, self.path + ".1")
+                self.file = open(self.path, "a", encoding="utf-8")
+                logger.info(f"Rotated telemetry log {self.path}")
+            self.file.write("".join(json.dumps(record) + "\n" for record in records))
+            self.file.flush()
+        except OSError as e:
+            logger.error(f"Failed to write telemetry to {self.path}: {e}")
+
+    def query(
+            self,
+            kind: str | None = None,
+            mode: str | None = None,
+            model: str | None = None
+    ) -> list[dict]:
+        """
+        Returns the stored records matching the given tags.
+        """
+        return [
+            record for record in self.records
+            if (kind is None or record["kind"] == kind)
+            and (mode is None or record["mode"] == mode)
+            and (model is None or record["model"] == model)
+        ]
+
+    def summary(
+            self,
+            kind: str | None = None,
+            mode: str | None = None,
+            model: str | None = None
+    ) -> dict:
+        """
+        Averages the stored records matching the given tags, fields without values are skipped.
+        """
+        records = self.query(kind, mode, model)
+        summary: dict = {"calls": len(records), "errors": sum(1 for record in records if record["error"])}
+        for field in ("queue_wait", "ttft", "latency", "gap_avg", "load_duration", "prefill_rate", "decode_rate"):
+            values = [record[field] for record in records if record[field] is not None]
+            summary[field] = sum(values) / len(values) if values else None
+        return summary
+
+    def models(self) -> set[tuple[str, str]]:
+        """
+        Returns the (mode, model) pairs with stored records.
+        """
+        return {(record["mode"], record["model"]) for record in self.records}
+
+    def close(self) -> None:
+        """
+        Writes the buffered records and closes the log, waiting for the writer thread.
+        """
+        self.flush()
+        self.writer.submit(self._close_file).result()
+
+    def _close_file(self) -> None:
+        if self.file:
+            self.file.close()
+            self.file = None
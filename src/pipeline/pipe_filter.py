@@ -114,6 +114,24 @@ class PipeFilter:
                 logger.debug(f"Extracted code: {self.extracted_code}")
                 return self.extracted_code
 
+        filtered_text, thoughts = self.filter_text(text)
+
+        self.ollama_client.last_response = filtered_text
+        self.ollama_client.thoughts.append(thoughts)
+
+        logger.debug(f"Filtered text: {filtered_text} \nThoughts: {thoughts}")
+        return filtered_text
+
+    @staticmethod
+    def filter_text(
+            text: str
+    ) -> tuple[str, list[str]]:
+        """
+        Removes thoughts and markdown emphasis from a static string without touching client state.
+
+        Returns:
+            tuple[str, list[str]]: The filtered text and the extracted thoughts.
+        """
         # Process thoughts and filter them
         thoughts = re.findall(r"<think>(.*?)</think>", text, flags=re.DOTALL)
         filtered_text = re.sub(r"<think>.*?</think>", "", text, flags=re.DOTALL)
@@ -121,13 +139,7 @@ class PipeFilter:
         # Apply additional line-based filtering
         pattern = re.compile(r'(#{3,4}|\*\*)')
         filtered_lines = [pattern.sub("", line) for line in filtered_text.splitlines()]
-        filtered_text = "\n".join(filtered_lines)
-
-        self.ollama_client.last_response = filtered_text
-        self.ollama_client.thoughts.append(thoughts)
-
-        logger.debug(f"Filtered text: {filtered_text} \nThoughts: {thoughts}")
-        return filtered_text
+        return "\n".join(filtered_lines), thoughts
 
     async def extract_shell_command(
             self, 
@@ -2,7 +2,7 @@ import os
 import re
 from ui.printer import printer
 from utils.logger import Logger
-from config.settings import Mode
+from config.settings import Mode, PRELOAD_MODELS
 from typing import Optional, Tuple
 from utils.file_utils import FileUtils
 from utils.shell_utils import CommandExecutor
@@ -102,6 +102,8 @@ class CommandProcessor:
                 return None
 
             mode_switcher(mode)
+            if PRELOAD_MODELS:
+                self.manager.client.preload(mode)
             logger.info(f"Mode detected: {mode.name}")
             return after_text
             
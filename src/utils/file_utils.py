@@ -10,7 +10,7 @@ from ui.printer import printer
 from utils.logger import Logger
 
 from ui.popups import RadiolistPopup
-from config.settings import IGNORE_DOT_FILES, SUPPORTED_EXTENSIONS, IGNORED_FOLDERS, MAX_FILE_SIZE, MAX_LINES, CHUNK_SIZE, PROCESS_IMAGES, IMG_INPUT_RES
+from config.settings import IGNORE_DOT_FILES, SUPPORTED_EXTENSIONS, IGNORED_FOLDERS, MAX_FILE_SIZE, MAX_LINES, CHUNK_SIZE, PROCESS_IMAGES, IMG_INPUT_RES, EMBED_BATCH_SIZE
 
 logger = Logger.get_logger()
 
@@ -23,6 +23,7 @@ class FileUtils:
         self.ui = manager.ui
         self.index_file = None
         self.add_folder = None
+        self.sync_folder = None
         self.file_locks = {}
 
         if PROCESS_IMAGES:
@@ -32,13 +33,15 @@ class FileUtils:
     def set_index_functions(
             self, 
             index_file:Callable, 
-            add_folder:Callable
+            add_folder:Callable,
+            sync_folder:Callable | None = None
     ) -> None:
         """
         Helper function to avoid circular import
         """
         self.index_file = index_file
         self.add_folder = add_folder
+        self.sync_folder = sync_folder
         
     async def process_file_or_folder(
             self, 
@@ -271,7 +274,7 @@ class FileUtils:
 
         for item in items:
             item_path = os.path.join(folder_path, item)
-            if os.path.isdir(item_path) and item not in ignored_folders and (not ignore_dot_files and item.startswith('.')):
+            if os.path.isdir(item_path) and item not in ignored_folders and not (ignore_dot_files and item.startswith('.')):
                 structure[folder_name][item] = self.generate_structure(item_path, root_folder, prefix + "--")
             elif os.path.isfile(item_path):
                 relative_path = os.path.relpath(item_path, root_folder) if root_folder else item_path
@@ -281,6 +284,64 @@ class FileUtils:
         return structure
    
 
+    def patch_structure(
+            self,
+            structure:dict,
+            root_folder:str,
+            added:list,
+            removed:list
+    ) -> None:
+        """
+        Updates a structure produced by generate_structure in place,
+        adding and removing the given file paths.
+        The structure keeps the folder name it was generated with (e.g. of a symlink to the root).
+        """
+        folder_name = next(iter(structure)) if len(structure) == 1 else os.path.basename(root_folder)
+        top = structure.setdefault(folder_name, {})
+
+        for file_path in removed:
+            parts = os.path.relpath(file_path, root_folder).split(os.sep)
+            node = top
+            for part in parts[:-1]:
+                node = node.get(part, {}).get(part)
+                if not isinstance(node, dict):
+                    break
+            else:
+                node.pop(parts[-1], None)
+
+        for file_path in added:
+            relative_path = os.path.relpath(file_path, root_folder)
+            parts = relative_path.split(os.sep)
+            node = top
+            for part in parts[:-1]:
+                node = node.setdefault(part, {part: {}}).setdefault(part, {})
+            node[parts[-1]] = relative_path
+
+        logger.info(f"Patched structure of {root_folder}: {len(added)} added, {len(removed)} removed")
+
+    def scan_folder(
+            self,
+            folder_path:str,
+            ignored_folders:list = IGNORED_FOLDERS,
+            ignore_dot_files:bool = IGNORE_DOT_FILES
+    ) -> dict[str, tuple[int, int]]:
+        """
+        Collects size and modification time of every file in the folder,
+        skipping the same folders as generate_structure.
+        """
+        stats = {}
+        for root, dirs, files in os.walk(folder_path):
+            dirs[:] = [d for d in dirs if d not in ignored_folders and not (ignore_dot_files and d.startswith('.'))]
+            for file in files:
+                file_path = os.path.join(root, file)
+                try:
+                    stat = os.stat(file_path)
+                except OSError as e:
+                    logger.error(f"Error reading file stats {file_path}: {e}")
+                    continue
+                stats[file_path] = (stat.st_size, stat.st_mtime_ns)
+        return stats
+
     async def read_folder(
             self, 
             folder_path:str, 
@@ -290,6 +351,8 @@ class FileUtils:
         """Recursively scans and reads all files in a folder.
            The folder structure is generated for all files; however, only files with safe extensions
            are attempted to be read (others are skipped).
+           When the folder was read before, only new or changed files are read again
+           and the known structure is patched instead of regenerated.
         """
         logger.info(f"Opening {folder_path}")
         printer(f"Opening {folder_path}",True)
@@ -298,27 +361,38 @@ class FileUtils:
             root_folder = folder_path
 
         all_contents = []  # To collect content from all files
+        pending_index = []  # Indexing calls run together so their embeddings are batched
 
         try:
-            printer(f"Generating structure for {folder_path}",True)
-            generated_structure = self.generate_structure(folder_path, root_folder)
-            if self.add_folder:
-                self.add_folder(generated_structure)
-
-            # Collecting content of all files
-            for root, _, files in os.walk(folder_path):
-                if any(ignored in root.split(os.sep) for ignored in ignored_folders):
-                    continue
-                for file in files:
-                    file_path = os.path.join(root, file)
-                
-                    content = await self.read_file(file_path)
-                    if self.index_file and content:
-                        await self.index_file(file_path, content, folder = True)
-                    elif content:
-                        file_contents = f"\n{content.strip()}\n"
-                        if file_contents:
-                            all_contents.append(file_contents)
+            stats = self.scan_folder(folder_path, ignored_folders)
+            changed = self.sync_folder(folder_path, stats) if self.sync_folder else None
+
+            if changed is None:
+                printer(f"Generating structure for {folder_path}",True)
+                generated_structure = self.generate_structure(folder_path, root_folder)
+                if self.add_folder:
+                    self.add_folder(generated_structure, folder_path)
+                changed = self.sync_folder(folder_path, stats) if self.sync_folder else None
+                if changed is None:
+                    changed = list(stats)
+
+            logger.info(f"{len(changed)} of {len(stats)} files in {folder_path} are new or changed")
+
+            # Collecting content of new and changed files
+            for file_path in sorted(changed):
+                content = await self.read_file(file_path)
+                if self.index_file and content:
+                    pending_index.append(self.index_file(file_path, content, folder = True))
+                    if len(pending_index) >= EMBED_BATCH_SIZE:
+                        await asyncio.gather(*pending_index)
+                        pending_index = []
+                elif content:
+                    file_contents = f"\n{content.strip()}\n"
+                    if file_contents:
+                        all_contents.append(file_contents)
+
+            if pending_index:
+                await asyncio.gather(*pending_index)
 
             logger.info(f"Reading files in {folder_path} complete")
 